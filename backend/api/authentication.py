@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+TOKEN_CACHE_KEY = 'auth_token:{}'
+
+# Поля пользователя, которые хранятся в кеше, в порядке объявления
+# в модели (этого требует Model.from_db). Остальные поля остаются
+# отложенными и подгружаются из БД только при обращении.
+CACHED_USER_FIELDS = (
+    'id', 'is_superuser', 'username', 'first_name', 'last_name',
+    'email', 'is_staff', 'is_active',
+)
+
+
+def invalidate_token(key):
+    cache.delete(TOKEN_CACHE_KEY.format(key))
+
+
+def invalidate_user_tokens(user):
+    keys = Token.objects.filter(user=user).values_list('key', flat=True)
+    cache.delete_many([TOKEN_CACHE_KEY.format(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену с кешированием пары токен-пользователь.
+
+    Пользователь хранится в кеше кортежем значений полей
+    CACHED_USER_FIELDS и восстанавливается без запроса к БД. С кешем
+    внутри процесса токен не кешируется: выход и смена пароля в одном
+    воркере не сбросили бы его в остальных.
+    """
+
+    def authenticate_credentials(self, key):
+        if not settings.CACHE_IS_SHARED:
+            return super().authenticate_credentials(key)
+        cache_key = TOKEN_CACHE_KEY.format(key)
+        values = cache.get(cache_key)
+        if values is None:
+            values = self.get_user_values(key)
+            cache.set(
+                cache_key, values, settings.AUTH_TOKEN_CACHE_TIMEOUT
+            )
+        if not values:
+            raise exceptions.AuthenticationFailed('Invalid token.')
+        user = User.from_db(DEFAULT_DB_ALIAS, CACHED_USER_FIELDS, values)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                'User inactive or deleted.'
+            )
+        token = Token.from_db(
+            DEFAULT_DB_ALIAS, ('key', 'user_id'), (key, user.id)
+        )
+        token.user = user
+        return user, token
+
+    def get_user_values(self, key):
+        # Пустой кортеж кешируется для несуществующих токенов,
+        # чтобы перебор ключей не нагружал БД.
+        values = User.objects.filter(auth_token__key=key).values_list(
+            *CACHED_USER_FIELDS
+        ).first()
+        return values or ()
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+RECIPE_BODY_KEY = 'recipe_body_stamped:{host}:{recipe_id}:{version}'
+RECIPE_LIST_KEY = 'recipe_list:{host}:{version}:{query}'
+RECIPE_LIST_VERSION_KEY = 'recipe_list_version'
+SINGLE_FLIGHT_LOCK_KEY = 'single_flight:{}'
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+class Flight:
+    """Вычисление значения, которого ждут другие потоки процесса."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+
+
+def get_or_build(key, build, timeout):
+    """Значение из кеша; при промахе его вычисляет один запрос.
+
+    Потоки процесса, пришедшие за тем же ключом, ждут результат
+    первого. Между процессами вычисление закрепляется блокировкой
+    в кеше (cache.add), остальные опрашивают кеш и, не дождавшись
+    за SINGLE_FLIGHT_WAIT секунд, вычисляют значение сами. Поэтому
+    потоки ждут первого дольше: его опрос кеша и само вычисление,
+    не дольше SINGLE_FLIGHT_LOCK_TIMEOUT.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Flight()
+    if not leader:
+        wait = (settings.SINGLE_FLIGHT_WAIT
+                + settings.SINGLE_FLIGHT_LOCK_TIMEOUT)
+        if flight.done.wait(wait) and (
+                flight.value is not None):
+            return flight.value
+        return build()
+    try:
+        flight.value = build_once(key, build, timeout)
+        return flight.value
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+def build_once(key, build, timeout):
+    lock_key = SINGLE_FLIGHT_LOCK_KEY.format(key)
+    if not cache.add(lock_key, True, settings.SINGLE_FLIGHT_LOCK_TIMEOUT):
+        deadline = time.monotonic() + settings.SINGLE_FLIGHT_WAIT
+        delay = 0.01
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+            value = cache.get(key)
+            if value is not None:
+                return value
+        lock_key = None
+    try:
+        value = build()
+        cache.set(key, value, timeout)
+        return value
+    finally:
+        if lock_key is not None:
+            cache.delete(lock_key)
+
+
+def recipe_version(updated_at):
+    """Версия рецепта: меняется при каждом сохранении.
+
+    Считается в целых микросекундах без float, чтобы version_datetime
+    возвращал в точности исходный момент.
+    """
+    return (updated_at - EPOCH) // MICROSECOND
+
+
+def version_datetime(version):
+    """Момент времени, соответствующий версии recipe_version."""
+    return EPOCH + version * MICROSECOND
+
+
+# Наибольшая версия, которой соответствует момент времени.
+MAX_VERSION = recipe_version(datetime.max.replace(tzinfo=timezone.utc))
+
+
+def get_recipe_body(request, recipe_id, version, build):
+    """Общая для всех зрителей часть ответа по рецепту из кеша
+    и отпечаток её содержимого.
+
+    build вызывается при промахе и должен вернуть тело ответа.
+    Отпечаток считается один раз при сборке и меняется, даже если
+    тело изменилось без смены версии рецепта (автор, теги).
+    """
+    key = RECIPE_BODY_KEY.format(
+        host=request.get_host(), recipe_id=recipe_id, version=version)
+
+    def build_stamped():
+        body = build()
+        digest = hashlib.sha1(json.dumps(
+            body, sort_keys=True, cls=DjangoJSONEncoder
+        ).encode()).hexdigest()
+        return body, digest
+
+    return get_or_build(key, build_stamped, settings.RECIPE_CACHE_TIMEOUT)
+
+
+def bump_recipe_list_version():
+    cache.set(RECIPE_LIST_VERSION_KEY, time.time(), None)
+
+
+def get_recipe_list(request, build):
+    """Страница списка рецептов для анонимного зрителя из кеша.
+
+    Ключ включает все параметры запроса и версию, которая меняется
+    при изменении рецептов, тегов и ингредиентов.
+    """
+    version = cache.get(RECIPE_LIST_VERSION_KEY)
+    if version is None:
+        version = time.time()
+        cache.add(RECIPE_LIST_VERSION_KEY, version, None)
+    query = urlencode(sorted(request.query_params.lists()), doseq=True)
+    key = RECIPE_LIST_KEY.format(
+        host=request.get_host(), version=version,
+        query=hashlib.sha1(query.encode()).hexdigest()
+    )
+    return get_or_build(key, build, settings.RECIPE_LIST_CACHE_TIMEOUT)
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if settings.CACHE_IS_SHARED:
+        return []
+    return [Warning(
+        'Кеш по умолчанию живёт внутри процесса.',
+        hint=(
+            'Задайте CACHE_BACKEND и CACHE_LOCATION общего кеша, '
+            'например memcached: иначе сброс кешей, блокировки и '
+            'ограничения частоты не работают между воркерами.'
+        ),
+        id='api.W001',
+    )]
@@ -0,0 +1,10 @@
+from outbox.events import consumer
+from .cache import bump_recipe_list_version
+
+
+@consumer('api.recipe_list', models=(
+    'recipes.recipe', 'recipes.ingredientforrecipe',
+    'recipes.tag', 'recipes.ingredient',
+))
+def refresh_recipe_list(events):
+    bump_recipe_list_version()
@@ -0,0 +1,64 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import exception_handler, set_rollback
+
+from foodgram.db import is_query_canceled
+from users.hashers import PasswordHashingBusyError
+
+logger = logging.getLogger(__name__)
+
+TIMEOUTS_KEY = 'metrics:statement_timeouts:{}'
+TIMEOUTS_INDEX_KEY = 'metrics:statement_timeouts'
+
+
+def count_statement_timeout(label):
+    """Счётчик прерванных по таймауту запросов в кеше. Список
+    счётчиков хранится в TIMEOUTS_INDEX_KEY."""
+    key = TIMEOUTS_KEY.format(label)
+    if cache.add(key, 1, None):
+        labels = cache.get(TIMEOUTS_INDEX_KEY, set())
+        cache.set(TIMEOUTS_INDEX_KEY, labels | {label}, None)
+    else:
+        cache.incr(key)
+
+
+def get_statement_timeout_counts():
+    labels = cache.get(TIMEOUTS_INDEX_KEY, set())
+    return {
+        label: cache.get(TIMEOUTS_KEY.format(label), 0)
+        for label in sorted(labels)
+    }
+
+
+def api_exception_handler(exc, context):
+    """Запрос к БД, прерванный по statement_timeout, и вход, не
+    дождавшийся слота хеширования пароля, превращаются в 503
+    с Retry-After; остальное обрабатывает DRF."""
+    if isinstance(exc, PasswordHashingBusyError):
+        set_rollback()
+        return Response(
+            {'detail': 'Сервер занят проверкой паролей, повторите позже.'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={'Retry-After': str(settings.PASSWORD_HASHING_WAIT)}
+        )
+    if isinstance(exc, OperationalError) and is_query_canceled(exc):
+        view = context['view']
+        label = (
+            f'{view.__class__.__name__}.{getattr(view, "action", None)}'
+        )
+        logger.warning('Превышено время запроса к БД: %s', label)
+        count_statement_timeout(label)
+        set_rollback()
+        return Response(
+            {'detail': 'Запрос выполнялся слишком долго, повторите позже.'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={
+                'Retry-After': str(settings.STATEMENT_TIMEOUT_RETRY_AFTER)
+            }
+        )
+    return exception_handler(exc, context)
@@ -1,7 +1,10 @@
 from django.contrib.auth import get_user_model
+from django.db.models import Exists, F, OuterRef, Q
+from django.db.models.functions import Lower
 from django_filters.rest_framework import CharFilter, FilterSet, filters
 
-from recipes.models import Ingredient, Recipe
+from recipes.catalogue import get_tag_catalogue
+from recipes.models import Favourite, Ingredient, Recipe, ShoppingList
 
 User = get_user_model()
 
@@ -14,9 +17,38 @@ class NameSearchFilter(FilterSet):
         fields = ('name',)
 
 
+class UserSearchFilter(FilterSet):
+    """Поиск по началу имени пользователя, имени или фамилии
+    без учёта регистра. Использует индексы по lower(...)."""
+    search = CharFilter(method='get_search', label='search')
+
+    class Meta:
+        model = User
+        fields = ('search',)
+
+    def get_search(self, queryset, name, value):
+        value = value.strip().lower()
+        if not value:
+            return queryset
+        return queryset.annotate(
+            username_lower=Lower('username'),
+            first_name_lower=Lower('first_name'),
+            last_name_lower=Lower('last_name'),
+        ).filter(
+            Q(username_lower__startswith=value)
+            | Q(first_name_lower__startswith=value)
+            | Q(last_name_lower__startswith=value)
+        )
+
+
+def tag_choices():
+    return [(tag['slug'], tag['name']) for tag in get_tag_catalogue()]
+
+
 class RecipeFilter(FilterSet):
-    tags = filters.AllValuesMultipleFilter(
-        field_name='tags__slug',
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices,
+        method='get_tags',
         label='tags'
     )
     is_favorited = filters.BooleanFilter(
@@ -27,17 +59,41 @@ class RecipeFilter(FilterSet):
         method='get_is_in_shopping_cart',
         label='is_in_shopping_cart'
     )
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'popular'), ('trending', 'trending')),
+        method='get_ordering',
+        label='ordering'
+    )
 
     class Meta:
         model = Recipe
         fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
 
+    def get_tags(self, queryset, name, value):
+        """Рецепты хотя бы с одним из тегов: EXISTS по id тегов
+        вместо JOIN, который размножает строки рецептов."""
+        tag_ids = [
+            tag['id'] for tag in get_tag_catalogue() if tag['slug'] in value
+        ]
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe_id=OuterRef('pk'), tag_id__in=tag_ids)
+        ))
+
     def get_is_favorited(self, queryset, name, value):
-        if value:
-            return queryset.filter(favorite__user=self.request.user)
-        return queryset
+        return self.filter_user_list(queryset, Favourite, value)
 
     def get_is_in_shopping_cart(self, queryset, name, value):
-        if value:
-            return queryset.filter(shopping_list__user=self.request.user)
-        return queryset
+        return self.filter_user_list(queryset, ShoppingList, value)
+
+    def filter_user_list(self, queryset, model, value):
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none() if value else queryset
+        in_list = Exists(
+            model.objects.filter(user=user, recipe=OuterRef('pk')))
+        return queryset.filter(in_list if value else ~in_list)
+
+    def get_ordering(self, queryset, name, value):
+        return queryset.order_by(
+            F(f'score__{value}').desc(nulls_last=True), '-pub_date')
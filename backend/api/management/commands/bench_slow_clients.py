@@ -0,0 +1,134 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузка медленными клиентами: пока они по байту отправляют '
+        'тело запроса или читают ответ, быстрые запросы замеряют '
+        'задержку. Запускается против WSGI- и ASGI-сервера по очереди.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Адрес для медленных клиентов')
+        parser.add_argument(
+            '--probe-url', help='Адрес быстрых запросов (по умолчанию url)')
+        parser.add_argument(
+            '--token', help='Токен для заголовка Authorization')
+        parser.add_argument(
+            '--mode', choices=('download', 'upload'), default='download',
+            help='Медленно читать ответ или медленно отправлять тело'
+        )
+        parser.add_argument('--slow-clients', type=int, default=50)
+        parser.add_argument(
+            '--delay', type=float, default=0.5,
+            help='Пауза медленного клиента между порциями, секунды'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=16,
+            help='Размер порции медленного клиента, байты'
+        )
+        parser.add_argument('--duration', type=float, default=10.0)
+        parser.add_argument('--probe-concurrency', type=int, default=4)
+
+    def handle(self, *args, **options):
+        self.options = options
+        latencies, errors = asyncio.run(self.run())
+        latencies.sort()
+        self.stdout.write(
+            f'Быстрых запросов: {len(latencies)}, ошибок: {errors}, '
+            f'в секунду: {len(latencies) / options["duration"]:.1f}'
+        )
+        if latencies:
+            for share in (0.5, 0.95, 0.99):
+                value = latencies[min(
+                    int(len(latencies) * share), len(latencies) - 1)]
+                self.stdout.write(
+                    f'p{int(share * 100)}: {value * 1000:.1f} мс')
+
+    async def run(self):
+        deadline = time.monotonic() + self.options['duration']
+        slow = [
+            asyncio.ensure_future(self.slow_client(deadline))
+            for _ in range(self.options['slow_clients'])
+        ]
+        await asyncio.sleep(0.5)
+        latencies = []
+        errors = [0]
+        await asyncio.gather(*(
+            self.probe(deadline, latencies, errors)
+            for _ in range(self.options['probe_concurrency'])
+        ))
+        for task in slow:
+            task.cancel()
+        await asyncio.gather(*slow, return_exceptions=True)
+        return latencies, errors[0]
+
+    def build_request(self, url, method='GET', body=b''):
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path = f'{path}?{parts.query}'
+        lines = [
+            f'{method} {path} HTTP/1.1',
+            f'Host: {parts.netloc}',
+            'Connection: close',
+        ]
+        if self.options['token']:
+            lines.append(f'Authorization: Token {self.options["token"]}')
+        if method != 'GET':
+            lines.append('Content-Type: application/json')
+            lines.append(f'Content-Length: {len(body)}')
+        head = ('\r\n'.join(lines) + '\r\n\r\n').encode()
+        return parts.hostname, parts.port or 80, head
+
+    async def slow_client(self, deadline):
+        url = self.options['url']
+        chunk_size = self.options['chunk_size']
+        while time.monotonic() < deadline:
+            try:
+                if self.options['mode'] == 'upload':
+                    body = b'{"recipes": [' + b'1, ' * 4096 + b'1]}'
+                    host, port, head = self.build_request(url, 'POST', body)
+                    reader, writer = await asyncio.open_connection(host, port)
+                    writer.write(head)
+                    for start in range(0, len(body), chunk_size):
+                        if time.monotonic() >= deadline:
+                            break
+                        writer.write(body[start:start + chunk_size])
+                        await writer.drain()
+                        await asyncio.sleep(self.options['delay'])
+                else:
+                    host, port, head = self.build_request(url)
+                    reader, writer = await asyncio.open_connection(host, port)
+                    writer.write(head)
+                    while time.monotonic() < deadline:
+                        if not await reader.read(chunk_size):
+                            break
+                        await asyncio.sleep(self.options['delay'])
+                writer.close()
+            except OSError:
+                await asyncio.sleep(self.options['delay'])
+
+    async def probe(self, deadline, latencies, errors):
+        url = self.options['probe_url'] or self.options['url']
+        host, port, head = self.build_request(url)
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+                writer.write(head)
+                status_line = await reader.readline()
+                await reader.read()
+                writer.close()
+            except OSError:
+                errors[0] += 1
+                await asyncio.sleep(0.1)
+                continue
+            if b' 200 ' in status_line:
+                latencies.append(time.monotonic() - started)
+            else:
+                errors[0] += 1
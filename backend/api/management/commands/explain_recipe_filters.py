@@ -0,0 +1,72 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.views import RecipeViewSet
+
+User = get_user_model()
+
+# Сочетания фильтров, которые отправляет фронтенд.
+QUERIES = (
+    '',
+    'tags=breakfast',
+    'tags=breakfast&tags=lunch&tags=dinner',
+    'is_favorited=1',
+    'is_in_shopping_cart=1',
+    'is_favorited=1&tags=breakfast',
+    'is_favorited=1&tags=breakfast&tags=lunch',
+    'author=1&tags=dinner',
+    'ordering=popular&tags=lunch',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Печатает планы и время запросов списка рецептов для '
+        'типичных сочетаний фильтров'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int,
+            help='id пользователя, от имени которого выполнять запросы'
+        )
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='EXPLAIN ANALYZE (только PostgreSQL)'
+        )
+        parser.add_argument('--limit', type=int, default=6)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        user = None
+        if options['user']:
+            user = User.objects.get(pk=options['user'])
+        for query in QUERIES:
+            http_request = factory.get(f'/api/recipes/?{query}')
+            if user is not None:
+                force_authenticate(http_request, user=user)
+            view = RecipeViewSet(
+                action_map={'get': 'list'}, format_kwarg=None,
+                args=(), kwargs={})
+            view.request = view.initialize_request(http_request)
+            try:
+                queryset = view.filter_queryset(view.get_queryset())
+            except ValidationError as error:
+                self.stdout.write(self.style.WARNING(
+                    f'?{query}: пропущено, {error.detail}'))
+                continue
+            page = queryset[:options['limit']]
+            started = time.perf_counter()
+            count = queryset.count()
+            list(page.values_list('id', flat=True))
+            elapsed = (time.perf_counter() - started) * 1000
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'?{query or "(без фильтров)"}: '
+                f'{count} рецептов, {elapsed:.1f} мс'
+            ))
+            explain = {'analyze': True} if options['analyze'] else {}
+            self.stdout.write(page.explain(**explain))
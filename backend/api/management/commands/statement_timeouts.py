@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from api.exceptions import get_statement_timeout_counts
+
+
+class Command(BaseCommand):
+    help = (
+        'Сколько раз действия API прерывались по statement_timeout '
+        '(счётчики в кеше с момента его запуска).'
+    )
+
+    def handle(self, *args, **options):
+        counts = get_statement_timeout_counts()
+        if not counts:
+            self.stdout.write('Прерванных запросов нет')
+            return
+        width = max(len(label) for label in counts)
+        for label, count in sorted(
+                counts.items(), key=lambda item: -item[1]):
+            self.stdout.write(f'{label:<{width}}  {count}')
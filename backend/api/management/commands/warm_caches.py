@@ -0,0 +1,85 @@
+import time
+from itertools import combinations
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from recipes.catalogue import get_tag_catalogue
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогрев кешей после деплоя: обход популярных адресов через '
+        'полный стек Django от имени анонимного посетителя. Подходит '
+        'для запуска при старте контейнера.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--host', default=self.default_host(),
+            help='Host, с которым приходят запросы через nginx: '
+                 'он входит в ключи кеша'
+        )
+        parser.add_argument(
+            '--max-tags', type=int, default=settings.WARM_CACHE_MAX_TAGS,
+            help='Наибольшее число тегов в сочетаниях для списка рецептов'
+        )
+        parser.add_argument(
+            '--recipes', type=int, default=settings.WARM_CACHE_RECIPES,
+            help='Сколько рецептов первой страницы прогреть'
+        )
+        parser.add_argument(
+            '--strict', action='store_true',
+            help='Завершиться с ошибкой, если какой-то адрес не ответил 200'
+        )
+
+    @staticmethod
+    def default_host():
+        hosts = [host for host in settings.ALLOWED_HOSTS if host != '*']
+        return hosts[0].lstrip('.') if hosts else 'localhost'
+
+    def handle(self, *args, **options):
+        if not settings.CACHE_IS_SHARED:
+            self.stdout.write(
+                'Кеш живёт внутри процесса: прогрев из команды не дойдёт '
+                'до воркеров веб-сервера, пропускаем.'
+            )
+            return
+        client = Client(HTTP_HOST=options['host'])
+        started = time.monotonic()
+        failed = 0
+        first_page = None
+        for path in self.get_paths(options['max_tags']):
+            response = self.warm(client, path)
+            failed += response.status_code != 200
+            if path == '/api/recipes/' and response.status_code == 200:
+                first_page = response.json()['results']
+        for recipe in (first_page or [])[:options['recipes']]:
+            response = self.warm(client, f'/api/recipes/{recipe["id"]}/')
+            failed += response.status_code != 200
+        self.stdout.write(
+            f'Готово за {(time.monotonic() - started) * 1000:.0f} мс, '
+            f'ошибок: {failed}'
+        )
+        if failed and options['strict']:
+            raise CommandError('Не все адреса удалось прогреть')
+
+    def get_paths(self, max_tags):
+        paths = list(settings.WARM_CACHE_PATHS)
+        slugs = [tag['slug'] for tag in get_tag_catalogue()]
+        for size in range(1, max_tags + 1):
+            for combination in combinations(slugs, size):
+                paths.append('/api/recipes/?' + urlencode(
+                    [('tags', slug) for slug in combination]))
+        return paths
+
+    def warm(self, client, path):
+        started = time.monotonic()
+        response = client.get(path)
+        self.stdout.write(
+            f'{response.status_code} '
+            f'{(time.monotonic() - started) * 1000:7.1f} мс  {path}'
+        )
+        return response
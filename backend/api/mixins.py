@@ -0,0 +1,33 @@
+from contextlib import ExitStack
+
+from django.conf import settings
+
+from foodgram.db import replica_statement_timeout, set_statement_timeout
+
+
+class StatementTimeoutMixin:
+    """Ограничение времени запросов к БД для действий представления.
+
+    Действия объявляют лимит в миллисекундах в statement_timeouts,
+    остальные получают STATEMENT_TIMEOUT. В основной БД лимит действует
+    до конца транзакции запроса (ATOMIC_REQUESTS), на репликах - до
+    конца обработки запроса. STATEMENT_TIMEOUT реплики получают
+    из OPTIONS, отличный от него лимит ставится на их сессию.
+    """
+    statement_timeouts = {}
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        milliseconds = self.statement_timeouts.get(
+            getattr(self, 'action', None), settings.STATEMENT_TIMEOUT)
+        set_statement_timeout(milliseconds)
+        self.replica_timeout = ExitStack()
+        if milliseconds != settings.STATEMENT_TIMEOUT:
+            self.replica_timeout.enter_context(
+                replica_statement_timeout(milliseconds))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        replica_timeout = getattr(self, 'replica_timeout', None)
+        if replica_timeout is not None:
+            replica_timeout.close()
+        return super().finalize_response(request, response, *args, **kwargs)
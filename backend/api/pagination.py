@@ -1,5 +1,17 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class PagePagination(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+class FeedPagination(CursorPagination):
+    """Постраничный вывод ленты по ключу без OFFSET"""
+    ordering = ('-pub_date', '-id')
+    page_size_query_param = 'limit'
+
+
+class UserCursorPagination(CursorPagination):
+    """Постраничный вывод пользователей по ключу без OFFSET и COUNT"""
+    ordering = 'id'
+    page_size_query_param = 'limit'
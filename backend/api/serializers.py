@@ -1,18 +1,25 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from djoser.serializers import UserCreateSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
+from jobs.queue import enqueue
 from recipes.models import (
     Favourite, Ingredient, IngredientForRecipe,
     Recipe, ShoppingList, Tag
 )
 from users.models import Subscription
+from .cache import MAX_VERSION
 
 User = get_user_model()
 
+# id в курсоре не больше bigint.
+MAX_CURSOR_ID = 2 ** 63 - 1
+
 
 class CustomUserCreateSerializer(UserCreateSerializer):
     email = serializers.EmailField(
@@ -69,6 +76,8 @@ class CustomUserSerializer(serializers.ModelSerializer):
         user = self.context.get('request').user
         if not user.is_authenticated:
             return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return Subscription.objects.filter(user=user, author=obj).exists()
 
 
@@ -109,8 +118,27 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
 
 
+def get_sparse_fields(request):
+    """Читает из запроса ?fields= и ?expand=.
+
+    Возвращает (fields, expand); fields равно None, если клиент
+    не ограничивал набор полей.
+    """
+    if request is None or 'fields' not in request.query_params:
+        return None, set()
+    fields = set(filter(None, request.query_params['fields'].split(',')))
+    expand = set(filter(None, request.query_params.get(
+        'expand', '').split(',')))
+    return fields, expand
+
+
 class RecipeSerializer(serializers.ModelSerializer):
-    """Сериализатор для рецептов"""
+    """Сериализатор для рецептов
+
+    ?fields=id,name,author оставляет в ответе только перечисленные
+    поля, связи author, tags и ingredients при этом выводятся
+    идентификаторами, если не перечислены в ?expand=.
+    """
     author = CustomUserSerializer(read_only=True)
     ingredients = IngredientForRecipeSerializer(
         many=True,
@@ -127,9 +155,23 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time'
         )
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields, expand = get_sparse_fields(self.context.get('request'))
+        if fields is None:
+            return
+        for name in set(self.fields) - fields:
+            self.fields.pop(name)
+        for name in ('author', 'tags', 'ingredients'):
+            if name in self.fields and name not in expand:
+                self.fields[name] = serializers.PrimaryKeyRelatedField(
+                    many=name != 'author', read_only=True)
+
     def get_is_favorited(self, obj):
         request = self.context.get('request')
         user = request.user
+        if hasattr(obj, 'is_favorited'):
+            return user.is_authenticated and obj.is_favorited
         return (
             user.is_authenticated
             and Favourite.objects.filter(
@@ -141,6 +183,8 @@ class RecipeSerializer(serializers.ModelSerializer):
     def get_is_in_shopping_cart(self, obj):
         request = self.context.get('request')
         user = request.user
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return user.is_authenticated and obj.is_in_shopping_cart
         return (
             user.is_authenticated
             and ShoppingList.objects.filter(
@@ -150,6 +194,45 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
 
 
+class CookRecipeSerializer(RecipeSerializer):
+    """Рецепт с долей ингредиентов, которые есть у пользователя"""
+    coverage = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('coverage',)
+
+
+class CookSearchSerializer(serializers.Serializer):
+    """Параметры поиска рецептов по имеющимся ингредиентам"""
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+    )
+    tags = serializers.ListField(
+        child=serializers.SlugField(),
+        required=False,
+    )
+
+
+class RecipeChangesSerializer(serializers.Serializer):
+    """Параметры синхронизации рецептов"""
+    since = serializers.RegexField(r'^\d+(-\d+)?$', default='0')
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=settings.RECIPE_CHANGES_LIMIT,
+        default=settings.RECIPE_CHANGES_LIMIT,
+    )
+
+    def validate_since(self, value):
+        """Курсор 'версия-id'; курсор из одной версии считается
+        стоящим перед всеми изменениями этого момента."""
+        version, _, pk = value.partition('-')
+        version, pk = int(version), int(pk or 0)
+        if version > MAX_VERSION or pk > MAX_CURSOR_ID:
+            raise serializers.ValidationError('Некорректный курсор')
+        return version, pk
+
+
 class RecipeCreateSerializer(serializers.ModelSerializer):
     """Сериализатор для создания рецептов"""
     tags = TagSerializer(many=True, read_only=True)
@@ -193,6 +276,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         data['ingredients'] = ingredients
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         tags = self.initial_data.get('tags')
         image = validated_data.pop('image')
@@ -213,8 +297,11 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             for ingredient in ingredients
         ]
         IngredientForRecipe.objects.bulk_create(objs=ingredient_list)
+        enqueue('recipes.fan_out_recipe', recipe_id=recipe.id)
+        enqueue('recipes.refresh_similar_recipes', dedupe=True)
         return recipe
 
+    @transaction.atomic
     def update(self, recipe, validated_data):
         recipe.tags.clear()
         tags = self.initial_data.get('tags')
@@ -243,29 +330,10 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             ]
             IngredientForRecipe.objects.bulk_create(objs=ingredient_list)
         recipe.save()
+        enqueue('recipes.refresh_similar_recipes', dedupe=True)
         return recipe
 
 
-class SubscribeSerializer(serializers.ModelSerializer):
-    """Сериализатор для проверки полей подписки"""
-    class Meta:
-        model = Subscription
-        fields = ['id', 'user', 'author']
-
-    def validate(self, data):
-        author = data['author']
-        user = data['user']
-        if user == author:
-            raise serializers.ValidationError({
-                'errors': 'Нельзя подписаться на себя'}
-            )
-        if Subscription.objects.filter(user=user, author=author).exists():
-            raise serializers.ValidationError({
-                'errors': 'Вы уже подписались на этого пользователя'}
-            )
-        return data
-
-
 class SubscriptionSerializer(serializers.ModelSerializer):
     """Сериализатор для подписок"""
     id = serializers.ReadOnlyField(source='author.id')
@@ -291,9 +359,7 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        return Subscription.objects.filter(
-            user=obj.user, author=obj.author
-        ).exists()
+        return True
 
     def get_recipes(self, obj):
         request = self.context.get('request')
@@ -307,34 +373,10 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         return Recipe.objects.filter(author=obj.author).count()
 
 
-class FavouriteSerializer(serializers.ModelSerializer):
-    """Сериализатор для избранных рецептов"""
-    class Meta:
-        model = Favourite
-        fields = ('id', 'user', 'recipe')
-
-    def validate(self, data):
-        request = self.context.get('request')
-        recipe = data['recipe']
-        if Favourite.objects.filter(user=request.user, recipe=recipe).exists():
-            raise serializers.ValidationError(
-                {'errors': 'Рецепт уже добавлен в избранное!'}
-            )
-        return data
-
-
-class ShoppingListSerializer(serializers.ModelSerializer):
-    """Сериализатор для списка покупок"""
-    class Meta:
-        model = ShoppingList
-        fields = ('id', 'user', 'recipe')
-
-    def validate(self, data):
-        request = self.context.get('request')
-        recipe = data['recipe']
-        if ShoppingList.objects.filter(user=request.user,
-                                       recipe=recipe).exists():
-            raise serializers.ValidationError(
-                {'errors': 'Рецепт уже добавлен в список покупок!'}
-            )
-        return data
+class RecipeIdsSerializer(serializers.Serializer):
+    """Сериализатор списка рецептов для пакетных операций"""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RECIPES_BATCH_LIMIT,
+    )
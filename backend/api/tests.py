@@ -0,0 +1,221 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import OperationalError
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from recipes.models import Recipe, RecipeTombstone
+from users.hashers import hashing_slots
+from .cache import recipe_version
+from .exceptions import get_statement_timeout_counts
+from .throttling import IPCostThrottle
+from .views import RecipeViewSet
+
+User = get_user_model()
+
+CHANGES_URL = '/api/recipes/changes/'
+
+
+@override_settings(RECIPE_CHANGES_LAG=0)
+class RecipeChangesTest(APITestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pw')
+        self.start = timezone.now() - timedelta(hours=1)
+
+    def create_recipe(self, name, updated_at):
+        recipe = Recipe.objects.create(
+            author=self.author, name=name, text='Текст',
+            cooking_time=5, image='recipe/images/recipe.png'
+        )
+        Recipe.objects.filter(pk=recipe.pk).update(updated_at=updated_at)
+        return recipe
+
+    def get_changes(self, since, limit=100):
+        response = self.client.get(
+            CHANGES_URL, {'since': since, 'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def sync(self, since, limit):
+        """Проходит все страницы и возвращает изменения по порядку."""
+        seen, deleted = [], []
+        while True:
+            page = self.get_changes(since, limit)
+            seen += [recipe['id'] for recipe in page['results']]
+            deleted += page['deleted']
+            since = page['cursor']
+            if not page['has_more']:
+                return seen, deleted, since
+
+    def test_pages_with_limit(self):
+        recipes = [
+            self.create_recipe(f'Рецепт {number}',
+                               self.start + timedelta(minutes=number))
+            for number in range(5)
+        ]
+        page = self.get_changes(0, limit=2)
+        self.assertEqual(
+            [recipe['id'] for recipe in page['results']],
+            [recipes[0].pk, recipes[1].pk]
+        )
+        self.assertTrue(page['has_more'])
+        seen, _, _ = self.sync(0, limit=2)
+        self.assertEqual(seen, [recipe.pk for recipe in recipes])
+
+    def test_ties_on_updated_at(self):
+        recipes = [
+            self.create_recipe(f'Рецепт {number}', self.start)
+            for number in range(5)
+        ]
+        seen, _, cursor = self.sync(0, limit=2)
+        self.assertEqual(seen, [recipe.pk for recipe in recipes])
+        self.assertEqual(
+            cursor, f'{recipe_version(self.start)}-{recipes[-1].pk}')
+        self.assertEqual(self.get_changes(cursor)['results'], [])
+
+    def test_tombstones_merged_with_updates(self):
+        first = self.create_recipe('Первый', self.start)
+        cursor = f'{recipe_version(self.start)}-{first.pk}'
+        removed = self.create_recipe('Удалённый', self.start)
+        removed_id = removed.pk
+        removed.delete()
+        RecipeTombstone.objects.filter(recipe_id=removed_id).update(
+            deleted_at=self.start + timedelta(minutes=1))
+        updated = self.create_recipe(
+            'Изменённый', self.start + timedelta(minutes=2))
+        page = self.get_changes(cursor, limit=1)
+        self.assertEqual(page['results'], [])
+        self.assertEqual(page['deleted'], [removed_id])
+        self.assertTrue(page['has_more'])
+        page = self.get_changes(page['cursor'], limit=1)
+        self.assertEqual(
+            [recipe['id'] for recipe in page['results']], [updated.pk])
+        self.assertEqual(page['deleted'], [])
+        self.assertFalse(page['has_more'])
+
+    @override_settings(RECIPE_TOMBSTONE_RETENTION_DAYS=1)
+    def test_expired_cursor(self):
+        expired = recipe_version(timezone.now() - timedelta(days=2))
+        response = self.client.get(CHANGES_URL, {'since': expired})
+        self.assertEqual(response.status_code, 410)
+
+    def test_out_of_range_cursor(self):
+        for since in ('9' * 30, f'0-{"9" * 30}'):
+            response = self.client.get(CHANGES_URL, {'since': since})
+            self.assertEqual(response.status_code, 400)
+
+
+@override_settings(REST_FRAMEWORK={
+    **settings.REST_FRAMEWORK,
+    'DEFAULT_THROTTLE_RATES': {'user_cost': '10/min', 'ip_cost': '10/min'},
+})
+class CostRateThrottleTest(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.request = APIRequestFactory().get('/api/recipes/')
+        self.now = 1000.0
+        patcher = mock.patch(
+            'api.throttling.time.time', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        cache.clear()
+
+    def consume(self, cost):
+        throttle = IPCostThrottle()
+        return throttle.consume(self.request, None, cost), throttle.wait()
+
+    def test_bucket_refills_over_time(self):
+        self.assertTrue(self.consume(4)[0])
+        self.assertTrue(self.consume(4)[0])
+        allowed, wait = self.consume(4)
+        self.assertFalse(allowed)
+        # Не хватает двух маркеров при пополнении 10 в минуту.
+        self.assertAlmostEqual(wait, 12)
+        self.now += 12
+        self.assertTrue(self.consume(4)[0])
+        self.assertFalse(self.consume(1)[0])
+
+    def test_bucket_does_not_overflow(self):
+        self.now += 3600
+        self.assertTrue(self.consume(10)[0])
+        self.assertFalse(self.consume(1)[0])
+
+    def test_cost_clamped_to_capacity(self):
+        self.assertTrue(self.consume(100)[0])
+        allowed, wait = self.consume(100)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 60)
+
+    def test_locked_bucket_rejects(self):
+        self.consume(1)
+        key = 'throttle_ip_cost_127.0.0.1:lock'
+        cache.add(key, True, 1)
+        with mock.patch('api.throttling.time.sleep'):
+            allowed, wait = self.consume(1)
+        self.assertFalse(allowed)
+        self.assertEqual(wait, IPCostThrottle.lock_timeout)
+        cache.delete(key)
+        self.assertTrue(self.consume(1)[0])
+
+
+class StatementTimeoutTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_canceled_query_returns_503(self):
+        error = OperationalError('canceling statement due to timeout')
+        error.__cause__ = Exception()
+        error.__cause__.pgcode = '57014'
+        with mock.patch.object(RecipeViewSet, 'list', side_effect=error):
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(
+            response['Retry-After'],
+            str(settings.STATEMENT_TIMEOUT_RETRY_AFTER)
+        )
+        self.assertEqual(
+            get_statement_timeout_counts(), {'RecipeViewSet.list': 1})
+
+    def test_other_operational_errors_are_not_masked(self):
+        error = OperationalError('server closed the connection')
+        with mock.patch.object(RecipeViewSet, 'list', side_effect=error):
+            with self.assertRaises(OperationalError):
+                self.client.get('/api/recipes/')
+
+
+class PasswordHashingBusyTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pw')
+
+    def tearDown(self):
+        cache.clear()
+
+    @override_settings(PASSWORD_HASHING_WAIT=0.01)
+    def test_login_without_free_slot_returns_503(self):
+        hashing_slots.acquire()
+        try:
+            response = self.client.post(
+                '/api/auth/token/login/',
+                {'email': 'user@example.com', 'password': 'pw'}
+            )
+        finally:
+            hashing_slots.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
@@ -0,0 +1,124 @@
+import time
+
+from django.core.cache import cache as default_cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+
+class CostRateThrottle(BaseThrottle):
+    """Ограничение частоты запросов с учётом их стоимости.
+
+    Корзина маркеров в кеше: ёмкость и скорость пополнения задаются
+    ставкой из DEFAULT_THROTTLE_RATES вида '600/min'. Запрос списывает
+    столько маркеров, сколько стоит его действие: представление
+    объявляет стоимости в throttle_costs ({действие: стоимость}) или
+    вычисляет её в get_throttle_cost(request). По умолчанию запрос
+    стоит 1; стоимость выше ёмкости корзины считается равной ёмкости.
+    """
+    cache = default_cache
+    cache_format = 'throttle_{scope}_{ident}'
+    scope = None
+    durations = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    # Блокировка корзины: срок жизни в секундах на случай упавшего
+    # процесса, число попыток её взять и пауза между ними.
+    lock_timeout = 1
+    lock_attempts = 10
+    lock_delay = 0.005
+
+    def __init__(self):
+        self.capacity, self.period = self.parse_rate(
+            api_settings.DEFAULT_THROTTLE_RATES[self.scope])
+        self.wait_time = None
+
+    def parse_rate(self, rate):
+        capacity, period = rate.split('/')
+        return int(capacity), self.durations[period[0]]
+
+    def get_ident_key(self, request, view):
+        raise NotImplementedError('get_ident_key() must be overridden')
+
+    @staticmethod
+    def get_cost(request, view):
+        if hasattr(view, 'get_throttle_cost'):
+            return view.get_throttle_cost(request)
+        return getattr(view, 'throttle_costs', {}).get(
+            getattr(view, 'action', None), 1)
+
+    def allow_request(self, request, view):
+        return self.consume(request, view, self.get_cost(request, view))
+
+    def consume(self, request, view, cost):
+        """Списывает маркеры под короткой блокировкой корзины
+        (cache.add), чтобы параллельные запросы клиента не прочитали
+        одно и то же состояние. Если блокировку не удалось взять за
+        lock_attempts попыток, запрос отклоняется."""
+        ident = self.get_ident_key(request, view)
+        if ident is None:
+            return True
+        key = self.cache_format.format(scope=self.scope, ident=ident)
+        lock_key = f'{key}:lock'
+        if not self.lock(lock_key):
+            self.wait_time = self.lock_timeout
+            return False
+        try:
+            return self.take(key, min(cost, self.capacity))
+        finally:
+            self.cache.delete(lock_key)
+
+    def lock(self, lock_key):
+        for _ in range(self.lock_attempts):
+            if self.cache.add(lock_key, True, self.lock_timeout):
+                return True
+            time.sleep(self.lock_delay)
+        return False
+
+    def take(self, key, cost):
+        rate = self.capacity / self.period
+        now = time.time()
+        tokens, updated_at = self.cache.get(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated_at) * rate)
+        if tokens < cost:
+            self.wait_time = (cost - tokens) / rate
+            return False
+        self.cache.set(key, (tokens - cost, now), self.period)
+        return True
+
+    def wait(self):
+        return self.wait_time
+
+
+class UserCostThrottle(CostRateThrottle):
+    """Корзина на пользователя; анонимных не ограничивает."""
+    scope = 'user_cost'
+
+    def get_ident_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return None
+
+
+class IPCostThrottle(CostRateThrottle):
+    """Корзина на адрес клиента для всех запросов с него."""
+    scope = 'ip_cost'
+
+    def get_ident_key(self, request, view):
+        return self.get_ident(request)
+
+
+def get_throttle_wait(request, cost):
+    """Проверяет ограничители из DEFAULT_THROTTLE_CLASSES для запроса
+    в обход DRF с явной стоимостью.
+
+    Как и DRF, опрашивает все ограничители. Возвращает None, если
+    запрос разрешён, иначе - через сколько секунд его повторить.
+    """
+    waits = []
+    for throttle_class in api_settings.DEFAULT_THROTTLE_CLASSES:
+        throttle = throttle_class()
+        if isinstance(throttle, CostRateThrottle):
+            allowed = throttle.consume(request, None, cost)
+        else:
+            allowed = throttle.allow_request(request, None)
+        if not allowed:
+            waits.append(throttle.wait() or 0)
+    return max(waits) if waits else None
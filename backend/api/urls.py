@@ -2,7 +2,8 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from .views import (
-    CustomUserViewSet, IngredientViewSet, RecipeViewSet, TagViewSet,
+    BootstrapView, CustomUserViewSet, IngredientViewSet,
+    RecipeViewSet, TagViewSet, TokenLoginView, export_shopping_cart,
 )
 
 app_name = 'api'
@@ -14,6 +15,13 @@ router.register('users', CustomUserViewSet, basename='users')
 router.register('recipes', RecipeViewSet, basename='recipes')
 
 urlpatterns = [
+    path('bootstrap/', BootstrapView.as_view(), name='bootstrap'),
+    path(
+        'recipes/download_shopping_cart/stream/',
+        export_shopping_cart,
+        name='shopping-cart-stream'
+    ),
     path('', include(router.urls)),
+    path('auth/token/login/', TokenLoginView.as_view(), name='login'),
     path('auth/', include('djoser.urls.authtoken'))
 ]
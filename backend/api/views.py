@@ -1,72 +1,164 @@
+import os
+from datetime import timedelta
+from functools import partial
+from operator import itemgetter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Prefetch, Q
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseNotAllowed,
+    JsonResponse, StreamingHttpResponse
+)
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import parse_etags
 from django_filters.rest_framework import DjangoFilterBackend
-from djoser.views import UserViewSet
-from rest_framework import permissions, status, viewsets
+from djoser.views import TokenCreateView, UserViewSet
+from rest_framework import exceptions, permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.relations import PrimaryKeyRelatedField
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from foodgram.db import (
+    insert_ignore_conflicts, oldest_write_started_at, pin_to_primary
+)
+from jobs.models import Job
+from jobs.queue import enqueue
+from outbox.events import get_payload, record_event
+from outbox.models import OutboxEvent
+from recipes.catalogue import get_ingredient_catalogue, get_tag_catalogue
+from recipes.feed import (
+    backfill_feed, get_feed_entries, get_feed_queryset,
+    get_followed_big_authors, prune_feed
+)
+from recipes.ingredient_index import ingredient_index
 from recipes.models import (
     Favourite, Ingredient, IngredientForRecipe,
-    Recipe, ShoppingList, Tag
+    Recipe, RecipeTombstone, ShoppingList, Tag
+)
+from recipes.shopping_list import (
+    artifact_path, get_cart_rows, iter_shopping_list, render_shopping_list
 )
 from users.models import Subscription
-from .filters import NameSearchFilter, RecipeFilter
-from .pagination import PagePagination
+from .authentication import CachedTokenAuthentication
+from .cache import (
+    get_recipe_body, get_recipe_list, recipe_version, version_datetime
+)
+from .filters import NameSearchFilter, RecipeFilter, UserSearchFilter
+from .mixins import StatementTimeoutMixin
+from .pagination import (
+    FeedPagination, PagePagination, UserCursorPagination,
+)
 from .permissions import IsAdminOrReadOnly, IsAuthorOrAdminOrReadOnly
 from .serializers import (
-    CustomUserSerializer, FavouriteSerializer,
-    IngredientSerializer, RecipeCreateSerializer,
-    RecipeSerializer, ShoppingListSerializer,
-    ShortRecipeSerializer, SubscribeSerializer,
-    SubscriptionSerializer, TagSerializer
+    CookRecipeSerializer, CookSearchSerializer,
+    CustomUserSerializer, IngredientSerializer,
+    RecipeChangesSerializer, RecipeCreateSerializer, RecipeIdsSerializer,
+    RecipeSerializer, ShortRecipeSerializer,
+    SubscriptionSerializer, TagSerializer, get_sparse_fields
 )
+from .throttling import get_throttle_wait
 
 User = get_user_model()
 
+SHOPPING_LIST_FILENAME = 'shopping_list.txt'
 
-class CustomUserViewSet(UserViewSet):
+
+def to_pk(value, field=None):
+    """Приводит идентификатор из URL к числу.
+
+    Нечисловой идентификатор даёт ошибку 400 с тем же текстом, что и
+    у PrimaryKeyRelatedField, если указано поле, иначе - 404.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        if field is None:
+            raise Http404
+        message = PrimaryKeyRelatedField.default_error_messages[
+            'incorrect_type']
+        raise exceptions.ValidationError(
+            {field: [str(message).format(data_type=type(value).__name__)]}
+        )
+
+
+class CustomUserViewSet(StatementTimeoutMixin, UserViewSet):
     queryset = User.objects.all()
     serializer_class = CustomUserSerializer
     pagination_class = PagePagination
+    filter_backends = (DjangoFilterBackend,)
+    filterset_class = UserSearchFilter
+    throttle_costs = {
+        'list': 2,
+        'subscriptions': 3,
+        'subscribe': 3,
+        'create': settings.PASSWORD_HASHING_THROTTLE_COST,
+        'set_password': 2 * settings.PASSWORD_HASHING_THROTTLE_COST,
+    }
+
+    def get_queryset(self):
+        queryset = super().get_queryset().order_by('id')
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset
+        return queryset.annotate(is_subscribed=Exists(
+            Subscription.objects.filter(user=user, author=OuterRef('pk'))
+        ))
+
+    def paginate_queryset(self, queryset):
+        """Список пользователей с параметром cursor (первая страница -
+        ?cursor=) отдаётся постранично по ключу, без него - как
+        раньше, по номеру страницы с count."""
+        cursor_param = UserCursorPagination.cursor_query_param
+        if (self.action == 'list'
+                and cursor_param in self.request.query_params):
+            self._paginator = UserCursorPagination()
+        return super().paginate_queryset(queryset)
 
     @action(
         detail=True,
         methods=['post'],
         permission_classes=[IsAuthenticated])
     def subscribe(self, request, id):
-        data = {'user': request.user.id, 'author': id}
-        serializer = SubscribeSerializer(
-            data=data,
-            context={'request': request},
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        queryset = Subscription.objects.filter(
-            user=data['user'],
-            author=data['author']
-        )
-        out_serializer = SubscriptionSerializer(
-            queryset,
-            many=True,
+        author = get_object_or_404(User, id=to_pk(id, 'author'))
+        if author == request.user:
+            return Response({
+                'errors': 'Нельзя подписаться на себя'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with transaction.atomic():
+                subscription = Subscription.objects.create(
+                    user=request.user,
+                    author=author
+                )
+        except IntegrityError:
+            return Response({
+                'errors': 'Вы уже подписались на этого пользователя'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        backfill_feed(request.user, author)
+        serializer = SubscriptionSerializer(
+            subscription,
             context={'request': request}
         )
-        return Response(*out_serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @subscribe.mapping.delete
     def unsubscribe(self, request, id=None):
-        user = request.user
-        author = get_object_or_404(User, id=id)
-        subscription = Subscription.objects.filter(
-            user=user,
-            author=author,
-        )
-        if subscription.exists():
-            subscription.delete()
+        id = to_pk(id)
+        deleted, _ = Subscription.objects.filter(
+            user=request.user,
+            author_id=id,
+        ).delete()
+        if deleted:
+            prune_feed(request.user, id)
             return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(User, id=id)
         return Response({
             'errors': 'Вы не подписаны на этого автора'
         }, status=status.HTTP_400_BAD_REQUEST)
@@ -84,13 +176,25 @@ class CustomUserViewSet(UserViewSet):
         return self.get_paginated_response(serializer.data)
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TokenLoginView(TokenCreateView):
+    """Вход по паролю: для ограничителя частоты стоит как вычисление
+    хеша Argon2."""
+
+    def get_throttle_cost(self, request):
+        return settings.PASSWORD_HASHING_THROTTLE_COST
+
+
+class TagViewSet(StatementTimeoutMixin, viewsets.ModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        return Response(get_tag_catalogue())
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+
+class IngredientViewSet(StatementTimeoutMixin,
+                        viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = [DjangoFilterBackend]
@@ -98,12 +202,191 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = (IsAdminOrReadOnly,)
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        # Поиск по началу названия с учётом регистра, как startswith
+        # в PostgreSQL, но по справочнику из кеша.
+        name = request.query_params.get('name')
+        ingredients = get_ingredient_catalogue()
+        if name:
+            ingredients = [
+                ingredient for ingredient in ingredients
+                if ingredient['name'].startswith(name)
+            ]
+        return Response(ingredients)
+
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(StatementTimeoutMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    # Стоимость действий для ограничения частоты запросов, в запросах
+    # к списку тегов. Дальние страницы списков дорожают: см.
+    # get_throttle_cost.
+    throttle_costs = {
+        'list': 2,
+        'feed': 2,
+        'cook': 5,
+        'bulk': 5,
+        'changes': 5,
+        'create': 20,
+        'update': 20,
+        'partial_update': 20,
+        'favorite_batch': 5,
+        'shopping_cart_batch': 5,
+        'download_shopping_cart': 30,
+        # POST download_shopping_cart только ставит задачу в очередь.
+        'enqueue_shopping_cart': 5,
+    }
+    deep_page_step = 10
+    # Лимиты времени запросов к БД в миллисекундах; остальные действия
+    # ограничены STATEMENT_TIMEOUT.
+    statement_timeouts = {
+        'list': 2000,
+        'feed': 2000,
+        'cook': 2000,
+        'bulk': 1000,
+        'retrieve': 1000,
+        'download_shopping_cart': 5000,
+    }
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method == 'GET':
+            return self.with_related(queryset)
+        return queryset
+
+    def get_throttle_cost(self, request):
+        if (self.action == 'download_shopping_cart'
+                and request.method == 'POST'):
+            return self.throttle_costs['enqueue_shopping_cart']
+        cost = self.throttle_costs.get(self.action, 1)
+        page = request.query_params.get('page', '')
+        if self.action in ('list', 'feed') and page.isdigit():
+            cost *= int(page) // self.deep_page_step + 1
+        return cost
+
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        build = partial(super().list, request, *args, **kwargs)
+        return Response(get_recipe_list(request, lambda: build().data))
+
+    def with_related(self, queryset):
+        """Подгружает связи и флаги, нужные RecipeSerializer.
+
+        Поля, исключённые через ?fields=, не читаются из БД.
+        """
+        fields, expand = get_sparse_fields(self.request)
+        if fields is None:
+            fields = set(RecipeSerializer.Meta.fields)
+            expand = fields
+        expand = expand & fields
+        if 'text' not in fields:
+            queryset = queryset.defer('text')
+        if 'author' in expand and not self.request.user.is_authenticated:
+            queryset = queryset.select_related('author')
+        if 'tags' in fields:
+            queryset = queryset.prefetch_related('tags')
+        if 'ingredients' in expand:
+            queryset = queryset.prefetch_related(Prefetch(
+                'ingredient_for_recipe',
+                queryset=IngredientForRecipe.objects.select_related(
+                    'ingredient')
+            ))
+        elif 'ingredients' in fields:
+            queryset = queryset.prefetch_related('ingredients')
+        if not self.request.user.is_authenticated:
+            return queryset
+        return self.with_viewer_flags(queryset, fields, expand)
+
+    def with_viewer_flags(self, queryset, fields, expand):
+        """Флаги избранного, списка покупок и подписки на автора
+        подзапросами Exists вместо запроса на каждый рецепт."""
+        user = self.request.user
+        if 'author' in expand:
+            queryset = queryset.prefetch_related(Prefetch(
+                'author',
+                queryset=User.objects.annotate(is_subscribed=Exists(
+                    Subscription.objects.filter(
+                        user=user, author=OuterRef('pk'))
+                ))
+            ))
+        if 'is_favorited' in fields:
+            queryset = queryset.annotate(is_favorited=Exists(
+                Favourite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ))
+        if 'is_in_shopping_cart' not in fields:
+            return queryset
+        return queryset.annotate(is_in_shopping_cart=Exists(
+            ShoppingList.objects.filter(user=user, recipe=OuterRef('pk'))
+        ))
+
+    def retrieve(self, request, *args, **kwargs):
+        """Тело рецепта берётся из кеша по версии рецепта, поверх него
+        накладываются флаги текущего пользователя. ETag складывается
+        из отпечатка тела и флагов."""
+        if 'fields' in request.query_params:
+            return super().retrieve(request, *args, **kwargs)
+        pk = to_pk(kwargs[self.lookup_field])
+        state = self.get_viewer_state(pk)
+        if state is None:
+            raise Http404
+        updated_at, is_favorited, is_in_shopping_cart, is_subscribed = state
+        body, digest = get_recipe_body(
+            request, pk, recipe_version(updated_at),
+            lambda: self.build_recipe_body(pk))
+        etag = '"{}-{}-{}{}{}"'.format(
+            pk, digest[:20],
+            int(is_favorited), int(is_in_shopping_cart), int(is_subscribed)
+        )
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED,
+                            headers=headers)
+        data = {
+            **body,
+            'author': {**body['author'], 'is_subscribed': is_subscribed},
+            'is_favorited': is_favorited,
+            'is_in_shopping_cart': is_in_shopping_cart,
+        }
+        return Response(data, headers=headers)
+
+    def get_viewer_state(self, pk):
+        """Дата изменения рецепта и флаги пользователя одним запросом."""
+        user = self.request.user
+        queryset = Recipe.objects.filter(pk=pk)
+        if not user.is_authenticated:
+            row = queryset.values_list('updated_at', flat=True).first()
+            return None if row is None else (row, False, False, False)
+        return queryset.annotate(
+            favorited=Exists(Favourite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            in_shopping_cart=Exists(ShoppingList.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            subscribed=Exists(Subscription.objects.filter(
+                user=user, author=OuterRef('author_id'))),
+        ).values_list(
+            'updated_at', 'favorited', 'in_shopping_cart', 'subscribed'
+        ).first()
+
+    def build_recipe_body(self, pk):
+        recipe = get_object_or_404(
+            Recipe.objects.select_related('author').prefetch_related(
+                'tags',
+                Prefetch(
+                    'ingredient_for_recipe',
+                    queryset=IngredientForRecipe.objects.select_related(
+                        'ingredient')
+                )
+            ),
+            pk=pk
+        )
+        recipe.is_favorited = False
+        recipe.is_in_shopping_cart = False
+        recipe.author.is_subscribed = False
+        return RecipeSerializer(
+            recipe, context={'request': self.request}).data
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -125,84 +408,430 @@ class RecipeViewSet(viewsets.ModelViewSet):
         if (self.action == 'list' or self.action == 'retrieve'
                 or self.action == 'create'):
             permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-        else:
+        elif self.action in ('update', 'partial_update', 'destroy'):
             permission_classes = [IsAuthorOrAdminOrReadOnly]
+        else:
+            return super().get_permissions()
         return [permission() for permission in permission_classes]
 
+    def add_to_list(self, model, pk, error):
+        """Добавляет рецепт в избранное или список покупок.
+
+        Повторное добавление отсекает уникальное ограничение в БД,
+        поэтому одновременные запросы не приводят к ошибке 500.
+        """
+        recipe = get_object_or_404(
+            Recipe.objects.only('id', 'name', 'image', 'cooking_time'),
+            pk=to_pk(pk, 'recipe')
+        )
+        try:
+            with transaction.atomic():
+                model.objects.create(user=self.request.user, recipe=recipe)
+        except IntegrityError:
+            return Response(
+                {'errors': error},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(
+            ShortRecipeSerializer(recipe).data,
+            status=status.HTTP_201_CREATED
+        )
+
+    def delete_from_list(self, model, pk, error):
+        """Удаляет рецепт из избранного или списка покупок одним запросом."""
+        pk = to_pk(pk)
+        deleted, _ = model.objects.filter(
+            user=self.request.user, recipe_id=pk).delete()
+        if deleted:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(Recipe, id=pk)
+        return Response(
+            {'error': error},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    @action(detail=False, permission_classes=[IsAuthenticated],
+            pagination_class=FeedPagination)
+    def feed(self, request):
+        """Лента подписок. Страница берётся из записей ленты, рецепты
+        к ней - одним запросом; подписки на крупных авторов требуют
+        выборки из самих рецептов."""
+        big_authors = get_followed_big_authors(request.user)
+        if big_authors:
+            page = self.paginate_queryset(self.with_related(
+                get_feed_queryset(request.user, big_authors)))
+        else:
+            entries = self.paginate_queryset(get_feed_entries(request.user))
+            recipes = self.with_related(Recipe.objects.all()).in_bulk(
+                [entry.recipe_id for entry in entries])
+            page = [
+                recipes[entry.recipe_id] for entry in entries
+                if entry.recipe_id in recipes
+            ]
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False)
+    def cook(self, request):
+        """Рецепты по ингредиентам, которые есть у пользователя:
+        ?ingredients=1,2,3&tags=breakfast"""
+        params = CookSearchSerializer(data={
+            'ingredients': request.query_params.get(
+                'ingredients', '').split(','),
+            'tags': request.query_params.getlist('tags'),
+        })
+        params.is_valid(raise_exception=True)
+        tags = params.validated_data.get('tags')
+        tag_ids = None
+        if tags:
+            tag_ids = [
+                tag['id'] for tag in get_tag_catalogue()
+                if tag['slug'] in tags
+            ]
+        recipe_ids, coverage = ingredient_index.search(
+            params.validated_data['ingredients'], tag_ids)
+        page = self.paginate_queryset(
+            list(zip(recipe_ids.tolist(), coverage.tolist())))
+        recipes = self.with_related(Recipe.objects.all()).in_bulk(
+            [recipe_id for recipe_id, _ in page])
+        results = []
+        for recipe_id, share in page:
+            if recipe_id in recipes:
+                recipes[recipe_id].coverage = round(share, 3)
+                results.append(recipes[recipe_id])
+        serializer = CookRecipeSerializer(
+            results, many=True, context={'request': request})
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False)
+    def changes(self, request):
+        """Рецепты, созданные или изменённые после курсора ?since=,
+        и id удалённых рецептов.
+
+        Курсор - 'версия-id' последнего отданного изменения, где
+        версия - время изменения в микросекундах. Ответ содержит курсор
+        для следующего запроса; при has_more стоит запросить сразу.
+        Изменения читаются из основной БД и только до начала самой
+        старой незавершённой транзакции: её записи получат более
+        ранние метки времени, чем уже отданные.
+        """
+        params = RecipeChangesSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        since, since_id = params.validated_data['since']
+        limit = params.validated_data['limit']
+        now = timezone.now()
+        horizon = now - timedelta(
+            days=settings.RECIPE_TOMBSTONE_RETENTION_DAYS)
+        if since and since < recipe_version(horizon):
+            return Response(
+                {'error': 'Курсор устарел, нужна полная синхронизация'},
+                status=status.HTTP_410_GONE
+            )
+        since_at = version_datetime(since)
+        with pin_to_primary():
+            until = now - timedelta(seconds=settings.RECIPE_CHANGES_LAG)
+            oldest = oldest_write_started_at()
+            if oldest is not None:
+                until = min(until, oldest)
+            changes = [
+                ((recipe.updated_at, recipe.id), recipe)
+                for recipe in self.get_queryset().filter(
+                    Q(updated_at__gt=since_at)
+                    | Q(updated_at=since_at, id__gt=since_id),
+                    updated_at__lt=until,
+                ).order_by('updated_at', 'id')[:limit + 1]
+            ]
+            if since:
+                changes += [
+                    ((deleted_at, pk), pk)
+                    for deleted_at, pk in RecipeTombstone.objects.filter(
+                        Q(deleted_at__gt=since_at)
+                        | Q(deleted_at=since_at, recipe_id__gt=since_id),
+                        deleted_at__lt=until,
+                    ).order_by('deleted_at', 'recipe_id').values_list(
+                        'deleted_at', 'recipe_id')[:limit + 1]
+                ]
+        changes.sort(key=itemgetter(0))
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        if changes:
+            last_at, since_id = changes[-1][0]
+            since = recipe_version(last_at)
+        serializer = self.get_serializer(
+            [item for _, item in changes if isinstance(item, Recipe)],
+            many=True
+        )
+        return Response({
+            'cursor': f'{since}-{since_id}',
+            'has_more': has_more,
+            'results': serializer.data,
+            'deleted': [
+                item for _, item in changes if not isinstance(item, Recipe)
+            ],
+        })
+
+    @action(detail=False)
+    def bulk(self, request):
+        """Рецепты по списку ?ids=1,2,3 в порядке запроса.
+
+        Отсутствующие id пропускаются. Запросы те же, что у списка,
+        и их число не зависит от количества рецептов.
+        """
+        ids = self.get_batch_ids({
+            'recipes': request.query_params.get('ids', '').split(',')
+        })
+        recipes = self.get_queryset().in_bulk(ids)
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in ids if pk in recipes], many=True)
+        return Response(serializer.data)
+
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        queryset = Recipe.objects.filter(
+            neighbour_of__recipe_id=to_pk(pk)
+        ).order_by('-neighbour_of__score')
+        serializer = ShortRecipeSerializer(
+            queryset, many=True, context={'request': request})
+        return Response(serializer.data)
+
+    def get_batch_ids(self, data=None):
+        serializer = RecipeIdsSerializer(
+            data=self.request.data if data is None else data)
+        serializer.is_valid(raise_exception=True)
+        return list(dict.fromkeys(serializer.validated_data['recipes']))
+
+    def add_batch_to_list(self, model):
+        """Добавляет пачку рецептов и возвращает результат по каждому id.
+
+        Существующие рецепты ищутся одним запросом, вставка - одним
+        INSERT ... ON CONFLICT DO NOTHING: 'added' получают только
+        строки, которые вставил именно этот запрос.
+        """
+        ids = self.get_batch_ids()
+        user = self.request.user
+        found = set(
+            Recipe.objects.filter(id__in=ids).values_list('id', flat=True))
+        inserted = insert_ignore_conflicts(
+            [
+                model(user=user, recipe_id=recipe_id)
+                for recipe_id in ids if recipe_id in found
+            ],
+            returning=('id', 'recipe_id'),
+        )
+        # Вставка в обход ORM не шлёт сигналов, события пишутся явно.
+        for entry_id, recipe_id in inserted:
+            entry = model(id=entry_id, user=user, recipe_id=recipe_id)
+            record_event(
+                model, entry_id, OutboxEvent.CREATED, get_payload(entry))
+        added = {recipe_id for _, recipe_id in inserted}
+        results = []
+        for recipe_id in ids:
+            if recipe_id not in found:
+                result = 'not_found'
+            elif recipe_id in added:
+                result = 'added'
+            else:
+                result = 'exists'
+            results.append({'id': recipe_id, 'status': result})
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+    def delete_batch_from_list(self, model):
+        """Удаляет пачку рецептов и возвращает результат по каждому id."""
+        ids = self.get_batch_ids()
+        entries = model.objects.filter(
+            user=self.request.user, recipe_id__in=ids)
+        in_list = set(entries.values_list('recipe_id', flat=True))
+        entries.filter(recipe_id__in=in_list).delete()
+        results = [
+            {
+                'id': recipe_id,
+                'status': 'deleted' if recipe_id in in_list else 'missing'
+            }
+            for recipe_id in ids
+        ]
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='favorite',
+            permission_classes=[IsAuthenticated])
+    def favorite_batch(self, request):
+        return self.add_batch_to_list(Favourite)
+
+    @favorite_batch.mapping.delete
+    def favorite_batch_delete(self, request):
+        return self.delete_batch_from_list(Favourite)
+
+    @action(detail=False, methods=['post'], url_path='shopping_cart',
+            permission_classes=[IsAuthenticated])
+    def shopping_cart_batch(self, request):
+        return self.add_batch_to_list(ShoppingList)
+
+    @shopping_cart_batch.mapping.delete
+    def shopping_cart_batch_delete(self, request):
+        return self.delete_batch_from_list(ShoppingList)
+
     @action(detail=True, methods=['post'],
             permission_classes=[IsAuthenticated])
     def favorite(self, request, pk=None):
-        data = {'user': request.user.id, 'recipe': pk}
-        serializer = FavouriteSerializer(
-            data=data,
-            context={'request': request})
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        recipe = Recipe.objects.filter(pk=data['recipe'])
-        out_serializer = ShortRecipeSerializer(recipe, many=True)
-        return Response(*out_serializer.data, status=status.HTTP_201_CREATED)
+        return self.add_to_list(
+            Favourite, pk, 'Рецепт уже добавлен в избранное!')
 
     @favorite.mapping.delete
     def favorite_delete(self, request, pk=None):
-        user = request.user
-        recipe = get_object_or_404(Recipe, id=pk)
-        favorite_check = Favourite.objects.filter(
-            user=user, recipe=recipe).exists()
-        if not favorite_check:
-            return Response(
-                {'error': 'Этого рецепта нет в избранных'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        favorite = get_object_or_404(Favourite, user=user, recipe=recipe)
-        favorite.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.delete_from_list(
+            Favourite, pk, 'Этого рецепта нет в избранных')
 
     @action(detail=True, methods=['post'],
             permission_classes=[IsAuthenticated])
     def shopping_cart(self, request, pk=None):
-        data = {'user': request.user.id, 'recipe': pk}
-        serializer = ShoppingListSerializer(
-            data=data,
-            context={'request': request})
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        recipe = Recipe.objects.filter(pk=data['recipe'])
-        out_serializer = ShortRecipeSerializer(recipe, many=True)
-        return Response(*out_serializer.data, status=status.HTTP_201_CREATED)
+        return self.add_to_list(
+            ShoppingList, pk, 'Рецепт уже добавлен в список покупок!')
 
     @shopping_cart.mapping.delete
     def shopping_cart_delete(self, request, pk=None):
-        user = request.user
-        recipe = get_object_or_404(Recipe, id=pk)
-        check_list = ShoppingList.objects.filter(
-            user=user, recipe=recipe).exists()
-        if not check_list:
+        return self.delete_from_list(
+            ShoppingList, pk, 'Этого рецепта нет в списке покупок')
+
+    @action(detail=False,
+            methods=['GET', 'POST'],
+            permission_classes=[IsAuthenticated])
+    def download_shopping_cart(self, request):
+        """GET отдаёт список сразу, POST ставит его подготовку в очередь
+        и возвращает id задачи. Потоковая выгрузка для ASGI -
+        export_shopping_cart."""
+        if request.method == 'POST':
+            queued = enqueue(
+                'recipes.build_shopping_list', dedupe=True,
+                max_attempts=3, user_id=request.user.id
+            )
             return Response(
-                {'error': 'Этого рецепта нет в списке покупок'},
-                status=status.HTTP_400_BAD_REQUEST
+                {'id': queued.id, 'status': queued.status},
+                status=status.HTTP_202_ACCEPTED
             )
-        shopping_list = get_object_or_404(
-            ShoppingList, user=user, recipe=recipe)
-        shopping_list.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        shopping_list = render_shopping_list(get_cart_rows(request.user.id))
+        response = HttpResponse(shopping_list, content_type='text/plain')
+        response['Content-Disposition'] = (
+            f'attachment; filename={SHOPPING_LIST_FILENAME}')
+        return response
 
     @action(detail=False,
             methods=['GET'],
+            url_path=r'download_shopping_cart/(?P<job_id>\d+)',
             permission_classes=[IsAuthenticated])
-    def download_shopping_cart(self, request):
-        all_ingredients = IngredientForRecipe.objects.filter(
-            recipe__shopping_list__user=request.user).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).order_by('ingredient__name').annotate(total=Sum('amount'))
-        shopping_list = []
-        for number, ingredient in enumerate(all_ingredients, 1):
-            shopping_list.append(
-                f'{number}. {ingredient["ingredient__name"]} - '
-                f'{ingredient["total"]} '
-                f'{ingredient["ingredient__measurement_unit"]} \n'
+    def shopping_cart_file(self, request, job_id=None):
+        """Статус подготовки списка, а после неё - сам файл.
+
+        Файл отдаёт nginx по заголовку X-Accel-Redirect.
+        """
+        queued = get_object_or_404(
+            Job, pk=job_id, name='recipes.build_shopping_list',
+            payload__user_id=request.user.id
+        )
+        if queued.status == Job.FAILED:
+            return Response({
+                'id': queued.id,
+                'status': queued.status,
+                'error': 'Не удалось подготовить список покупок, '
+                         'запросите его ещё раз',
+            })
+        if queued.status != Job.DONE:
+            return Response(
+                {'id': queued.id, 'status': queued.status},
+                status=status.HTTP_202_ACCEPTED
             )
-        filename = 'shopping_list.txt'
-        response = HttpResponse(shopping_list, content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename={filename}'
+        digest = queued.result['digest']
+        path = artifact_path(digest)
+        if not os.path.exists(path):
+            raise Http404
+        if settings.SHOPPING_LIST_X_ACCEL:
+            response = HttpResponse(content_type='text/plain')
+            response['X-Accel-Redirect'] = (
+                f'{settings.SHOPPING_LIST_ACCEL_PREFIX}{digest}.txt')
+        else:
+            response = FileResponse(
+                open(path, 'rb'), content_type='text/plain')
+        response['Content-Disposition'] = (
+            f'attachment; filename={SHOPPING_LIST_FILENAME}')
+        return response
+
+
+class BootstrapView(StatementTimeoutMixin, APIView):
+    """Данные для первой загрузки страницы одним запросом: теги,
+    текущий пользователь и первая страница рецептов.
+
+    Параметры запроса работают как фильтры списка рецептов, а каждая
+    часть ответа совпадает с ответом своего эндпоинта.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get_throttle_cost(self, request):
+        return 4
+
+    def get(self, request):
+        user = request.user
+        me = None
+        if user.is_authenticated:
+            me = CustomUserSerializer(
+                user, context={'request': request}).data
+        return Response({
+            'tags': get_tag_catalogue(),
+            'me': me,
+            'recipes': self.get_recipes_page(request),
+        })
+
+    def get_recipes_page(self, request):
+        view = RecipeViewSet(
+            action_map={'get': 'list'}, action='list', request=request,
+            format_kwarg=None, args=(), kwargs={}
+        )
+        page = view.paginate_queryset(
+            view.filter_queryset(view.get_queryset()))
+        data = view.get_paginated_response(
+            view.get_serializer(page, many=True).data).data
+        # Ссылки пагинатора ведут на список рецептов, а не сюда.
+        for link in ('next', 'previous'):
+            if data.get(link):
+                data[link] = data[link].replace(
+                    request.path, reverse('api:recipes-list'), 1)
+        return data
+
+
+@transaction.non_atomic_requests
+async def export_shopping_cart(request):
+    """Потоковая выгрузка списка покупок.
+
+    Асинхронное представление: при запуске под ASGI медленный клиент
+    занимает только сопрограмму, а не поток воркера. Обращения к кешу
+    и БД выполняются в потоке через sync_to_async. DRF не поддерживает
+    асинхронные представления, поэтому аутентификация вызывается
+    напрямую, а ограничение частоты - через get_throttle_wait с той
+    же стоимостью, что у синхронной выгрузки.
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    try:
+        credentials = await sync_to_async(
+            CachedTokenAuthentication().authenticate)(request)
+    except exceptions.AuthenticationFailed as error:
+        credentials, detail = None, error.detail
+    else:
+        detail = exceptions.NotAuthenticated.default_detail
+    if credentials is None:
+        return JsonResponse(
+            {'detail': str(detail)}, status=status.HTTP_401_UNAUTHORIZED)
+    request.user, _ = credentials
+    wait = await sync_to_async(get_throttle_wait)(
+        request, RecipeViewSet.throttle_costs['download_shopping_cart'])
+    if wait is not None:
+        throttled = exceptions.Throttled(wait)
+        response = JsonResponse(
+            {'detail': str(throttled.detail)},
+            status=status.HTTP_429_TOO_MANY_REQUESTS
+        )
+        response['Retry-After'] = str(throttled.wait)
         return response
+    rows = await sync_to_async(get_cart_rows)(request.user.id)
+    response = StreamingHttpResponse(
+        iter_shopping_list(rows), content_type='text/plain')
+    response['Content-Disposition'] = (
+        f'attachment; filename={SHOPPING_LIST_FILENAME}')
+    return response
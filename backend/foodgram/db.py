@@ -0,0 +1,210 @@
+import hashlib
+import random
+import time
+from contextlib import ExitStack, contextmanager
+
+from asgiref.local import Local
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, router
+from rest_framework.permissions import SAFE_METHODS
+
+PIN_CACHE_KEY = 'db_pin:{}'
+
+# SQLSTATE query_canceled: запрос прерван по statement_timeout.
+QUERY_CANCELED = '57014'
+
+_state = Local()
+
+
+def is_pinned_to_primary():
+    return getattr(_state, 'pinned', False)
+
+
+@contextmanager
+def pin_to_primary():
+    """Направляет чтения внутри блока в основную БД.
+
+    Фоновые задачи и получатели событий читают то, что только что
+    записано, и отставание реплик для них недопустимо.
+    """
+    pinned = is_pinned_to_primary()
+    _state.pinned = True
+    try:
+        yield
+    finally:
+        _state.pinned = pinned
+
+
+def set_statement_timeout(milliseconds, using=DEFAULT_DB_ALIAS):
+    """Ограничивает время запросов до конца текущей транзакции.
+
+    Работает только в PostgreSQL и только внутри транзакции
+    (SET LOCAL); в остальных случаях ничего не делает.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql' or not connection.in_atomic_block:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SET LOCAL statement_timeout = %s', [milliseconds])
+
+
+@contextmanager
+def replica_statement_timeout(milliseconds):
+    """Ограничивает время запросов к репликам внутри блока.
+
+    Реплики читаются вне транзакции, поэтому лимит ставится на сессию
+    (SET) перед первым запросом к реплике в блоке и снимается (RESET)
+    на выходе - возвращается значение из OPTIONS. Только PostgreSQL.
+    """
+    applied = []
+
+    def apply(execute, sql, params, many, context):
+        connection = context['connection']
+        if connection.vendor == 'postgresql' and connection not in applied:
+            applied.append(connection)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SET statement_timeout = %s', [milliseconds])
+        return execute(sql, params, many, context)
+
+    try:
+        with ExitStack() as stack:
+            for alias in settings.DATABASE_REPLICAS:
+                stack.enter_context(connections[alias].execute_wrapper(apply))
+            yield
+    finally:
+        for connection in applied:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('RESET statement_timeout')
+            except DatabaseError:
+                # Соединение с неизвестным лимитом не должно вернуться
+                # к следующему запросу.
+                connection.close()
+
+
+def is_query_canceled(error):
+    return getattr(error.__cause__, 'pgcode', None) == QUERY_CANCELED
+
+
+def oldest_write_started_at(using=DEFAULT_DB_ALIAS):
+    """Начало самой старой незавершённой пишущей транзакции.
+
+    Всё, что она запишет, получит метки времени не раньше этого
+    момента. Известно только в PostgreSQL, в остальных случаях None.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT min(xact_start) FROM pg_stat_activity '
+            'WHERE backend_xid IS NOT NULL '
+            'AND datname = current_database() '
+            'AND pid <> pg_backend_pid()'
+        )
+        return cursor.fetchone()[0]
+
+
+def insert_ignore_conflicts(objs, returning):
+    """Вставляет объекты, пропуская конфликтующие, и возвращает вставленные.
+
+    INSERT ... ON CONFLICT DO NOTHING RETURNING (PostgreSQL, SQLite 3.35+)
+    возвращает только строки, которые действительно вставил этот
+    запрос: строка, добавленная параллельно, в результат не попадёт.
+    Значения полей готовятся так же, как в bulk_create.
+    """
+    if not objs:
+        return []
+    model = type(objs[0])
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    fields = [
+        field for field in model._meta.concrete_fields
+        if field is not model._meta.auto_field
+    ]
+    placeholders = '({})'.format(', '.join(['%s'] * len(fields)))
+    sql = 'INSERT INTO {} ({}) VALUES {} ON CONFLICT DO NOTHING RETURNING {}'
+    sql = sql.format(
+        quote(model._meta.db_table),
+        ', '.join(quote(field.column) for field in fields),
+        ', '.join([placeholders] * len(objs)),
+        ', '.join(quote(column) for column in returning),
+    )
+    params = [
+        field.get_db_prep_save(field.pre_save(obj, True), connection)
+        for obj in objs for field in fields
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+class PrimaryReplicaRouter:
+    """Чтения уходят в реплики, запись и миграции - в основную БД."""
+
+    def db_for_read(self, model, **hints):
+        if is_pinned_to_primary() or not settings.DATABASE_REPLICAS:
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class PrimaryPinMiddleware:
+    """Закрепляет чтения пользователя за основной БД после записи.
+
+    Изменяющие запросы целиком читают из основной БД, а их автор
+    ещё REPLICA_PIN_SECONDS секунд не видит отставания реплик.
+    Заодно проверяет постоянные соединения перед обработкой запроса,
+    но не чаще раза в DB_CONN_HEALTH_CHECK_INTERVAL секунд на каждое.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if settings.DB_CONN_HEALTH_CHECKS:
+            self.close_unusable_connections()
+        pin_key = self.get_pin_key(request)
+        is_write = request.method not in SAFE_METHODS
+        _state.pinned = is_write or (
+            pin_key is not None and cache.get(pin_key, False)
+        )
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.pinned = False
+        if is_write and pin_key is not None and response.status_code < 400:
+            cache.set(pin_key, True, settings.REPLICA_PIN_SECONDS)
+        return response
+
+    @staticmethod
+    def get_pin_key(request):
+        credentials = request.META.get('HTTP_AUTHORIZATION')
+        if not credentials:
+            return None
+        digest = hashlib.sha1(credentials.encode()).hexdigest()
+        return PIN_CACHE_KEY.format(digest)
+
+    @staticmethod
+    def close_unusable_connections():
+        now = time.monotonic()
+        interval = settings.DB_CONN_HEALTH_CHECK_INTERVAL
+        for connection in connections.all():
+            if connection.connection is None or connection.in_atomic_block:
+                continue
+            checked_at = getattr(connection, 'health_checked_at', None)
+            if checked_at is not None and now - checked_at < interval:
+                continue
+            connection.health_checked_at = now
+            if not connection.is_usable():
+                connection.close()
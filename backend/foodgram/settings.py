@@ -17,6 +17,8 @@ INSTALLED_APPS = [
     'api.apps.ApiConfig',
     'recipes.apps.RecipesConfig',
     'users.apps.UsersConfig',
+    'jobs.apps.JobsConfig',
+    'outbox.apps.OutboxConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -32,6 +34,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'foodgram.db.PrimaryPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -68,10 +71,71 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='db'),
-        'PORT': os.getenv('DB_PORT', default='5432')
+        'PORT': os.getenv('DB_PORT', default='5432'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
+        # Изменения и их события в outbox фиксируются одной транзакцией.
+        'ATOMIC_REQUESTS': True,
     }
 }
 
+# Лимит времени запроса к БД в миллисекундах для действий API, не
+# объявивших свой (statement_timeouts), и пауза перед повтором после
+# ответа 503 в секундах. Действует только в PostgreSQL.
+STATEMENT_TIMEOUT = int(os.getenv('STATEMENT_TIMEOUT', default=5000))
+STATEMENT_TIMEOUT_RETRY_AFTER = 5
+
+# Проверять постоянные соединения перед обработкой запроса.
+DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS', default='1') == '1'
+# Не проверять одно соединение чаще, чем раз в столько секунд.
+DB_CONN_HEALTH_CHECK_INTERVAL = int(
+    os.getenv('DB_CONN_HEALTH_CHECK_INTERVAL', default=10))
+
+# Реплики для чтения: DB_REPLICA_HOSTS=replica1,replica2
+DATABASE_REPLICAS = []
+for number, host in enumerate(
+        filter(None, os.getenv('DB_REPLICA_HOSTS', default='').split(',')), 1):
+    alias = f'replica_{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'ATOMIC_REQUESTS': False,
+        'TEST': {'MIRROR': 'default'},
+    }
+    if 'postgresql' in DATABASES[alias]['ENGINE']:
+        # Чтения из реплик идут вне транзакции, и SET LOCAL к ним не
+        # применить: для них лимит задаётся на всё соединение.
+        DATABASES[alias]['OPTIONS'] = {
+            'options': f'-c statement_timeout={STATEMENT_TIMEOUT}',
+        }
+    DATABASE_REPLICAS.append(alias)
+
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS = ['foodgram.db.PrimaryReplicaRouter']
+
+# Сколько секунд после записи читать данные пользователя из основной БД.
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', default=5))
+
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+# Кеш виден всем процессам. Процессный кеш (LocMem) годится только
+# для разработки в одном процессе: сброс кешей, блокировки и
+# ограничения частоты из других процессов до него не доходят.
+CACHE_IS_SHARED = CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Время жизни кешированной пары токен-пользователь, в секундах.
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', default=60))
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -88,6 +152,27 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Argon2id с параметрами, близкими к минимальным рекомендациям OWASP
+# (19 МиБ, 2 прохода, 1 поток): вход дешевле PBKDF2 по процессору.
+# Остальные хешеры нужны для проверки старых паролей, которые
+# пересчитываются при входе.
+PASSWORD_HASHERS = [
+    'users.hashers.TunedArgon2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+ARGON2_TIME_COST = int(os.getenv('ARGON2_TIME_COST', default=2))
+ARGON2_MEMORY_COST = int(os.getenv('ARGON2_MEMORY_COST', default=19 * 1024))
+ARGON2_PARALLELISM = int(os.getenv('ARGON2_PARALLELISM', default=1))
+# Сколько паролей процесс хеширует одновременно и сколько секунд запрос
+# ждёт свободного слота, прежде чем получить 503 с Retry-After.
+PASSWORD_HASHING_CONCURRENCY = int(
+    os.getenv('PASSWORD_HASHING_CONCURRENCY', default=1))
+PASSWORD_HASHING_WAIT = 2
+# Стоимость одного вычисления хеша пароля для ограничителя частоты
+# (api.throttling): вход, регистрация, смена пароля.
+PASSWORD_HASHING_THROTTLE_COST = 20
+
 
 LANGUAGE_CODE = 'ru-RU'
 
@@ -113,13 +198,135 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ),
 
     'DEFAULT_PAGINATION_CLASS':
         'api.pagination.PagePagination',
         'PAGE_SIZE': 6,
+
+    # Стоимость действий объявляется в представлениях (throttle_costs),
+    # ставки - ёмкость корзины маркеров и срок её полного пополнения.
+    'DEFAULT_THROTTLE_CLASSES': (
+        'api.throttling.UserCostThrottle',
+        'api.throttling.IPCostThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'user_cost': os.getenv('THROTTLE_USER_RATE', default='600/min'),
+        'ip_cost': os.getenv('THROTTLE_IP_RATE', default='1200/min'),
+    },
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', default=1)),
+
+    'EXCEPTION_HANDLER': 'api.exceptions.api_exception_handler',
+}
+
+# Максимум рецептов в одном пакетном запросе.
+RECIPES_BATCH_LIMIT = 100
+
+# Лента подписок: авторы, у которых подписчиков больше
+# FEED_FANOUT_MAX_FOLLOWERS, подмешиваются в ленту при чтении.
+FEED_FANOUT_MAX_FOLLOWERS = int(
+    os.getenv('FEED_FANOUT_MAX_FOLLOWERS', default=10000))
+# Как долго, в секундах, помнить список крупных авторов.
+FEED_BIG_AUTHORS_TIMEOUT = 300
+FEED_BATCH_SIZE = 1000
+FEED_BACKFILL_SIZE = 50
+
+# Сколько похожих рецептов хранить для каждого рецепта.
+SIMILAR_RECIPES_TOP_K = 10
+# Запас к отметке прошлого расчёта на незавершённые транзакции, в секундах.
+SIMILAR_RECIPES_OVERLAP = 300
+
+# Затухание популярности рецептов (compute_recipe_scores), в днях.
+POPULAR_HALF_LIFE_DAYS = 30
+TRENDING_HALF_LIFE_DAYS = 2
+TRENDING_WINDOW_DAYS = 7
+
+# Сколько секунд хранить в кеше общую часть ответа по рецепту.
+RECIPE_CACHE_TIMEOUT = 600
+# Сколько секунд хранить справочники тегов и ингредиентов. Изменения
+# сбрасывают их сразу, срок страхует от потерянного сброса.
+CATALOGUE_CACHE_TIMEOUT = 300
+# Сколько секунд хранить страницы списка рецептов для анонимных
+# зрителей. Изменения рецептов сбрасывают их сразу, срок ограничивает
+# устаревание рейтингов и данных авторов.
+RECIPE_LIST_CACHE_TIMEOUT = 60
+# Ответы при промахе кеша вычисляет один запрос (api.cache.get_or_build):
+# сколько секунд запросы других процессов ждут его результат и на сколько
+# секунд берётся блокировка в кеше - это же предел времени вычисления.
+# Потоки того же процесса ждут своего вычисляющего обе величины.
+SINGLE_FLIGHT_WAIT = 2
+SINGLE_FLIGHT_LOCK_TIMEOUT = 10
+
+# Фоновые задачи (jobs). В режиме JOBS_EAGER задачи выполняются
+# в процессе веб-сервера сразу после фиксации транзакции.
+JOBS_EAGER = os.getenv('JOBS_EAGER', default='0') == '1'
+JOBS_CONCURRENCY = int(os.getenv('JOBS_CONCURRENCY', default=2))
+JOBS_RETRY_BASE_DELAY = 10
+JOBS_RETRY_MAX_DELAY = 60 * 60
+JOBS_LOCK_TIMEOUT = 10 * 60
+
+# Периодические задачи: имя задачи -> интервал в секундах между
+# запусками. В очередь их ставит run_worker.
+JOBS_SCHEDULE = {
+    'recipes.compute_recipe_scores': 15 * 60,
+    'recipes.prune_shopping_lists': 60 * 60,
+    'recipes.prune_recipe_tombstones': 24 * 60 * 60,
 }
+JOBS_SCHEDULE_LOCK_KEY = 'jobs_schedule_lock'
+
+# Модели, изменения которых пишутся в outbox.
+OUTBOX_MODELS = [
+    'recipes.Ingredient',
+    'recipes.Recipe',
+    'recipes.IngredientForRecipe',
+    'recipes.Tag',
+    'recipes.Favourite',
+    'recipes.ShoppingList',
+    'users.Subscription',
+]
+# В режиме OUTBOX_EAGER события доставляются сразу после фиксации
+# транзакции в процессе веб-сервера, без dispatch_outbox. С кешем
+# внутри процесса сброс из dispatch_outbox не дошёл бы до веб-сервера,
+# поэтому там этот режим включён по умолчанию.
+OUTBOX_EAGER = os.getenv(
+    'OUTBOX_EAGER', default='0' if CACHE_IS_SHARED else '1') == '1'
+OUTBOX_BATCH_SIZE = 500
+# После стольких неудачных попыток событие больше не доставляется.
+OUTBOX_MAX_ATTEMPTS = 5
+# Сколько дней хранить доставленные события.
+OUTBOX_RETENTION_DAYS = 7
+
+# Готовые списки покупок. Файлы отдаёт nginx по заголовку
+# X-Accel-Redirect из internal-location с префиксом
+# SHOPPING_LIST_ACCEL_PREFIX; без nginx их отдаёт Django.
+SHOPPING_LIST_DIR = os.path.join(MEDIA_ROOT, 'shopping_lists')
+SHOPPING_LIST_ACCEL_PREFIX = '/protected/shopping_lists/'
+SHOPPING_LIST_X_ACCEL = os.getenv(
+    'SHOPPING_LIST_X_ACCEL', default='1') == '1'
+# Сколько дней хранить файлы списков, которые никто не запрашивал.
+SHOPPING_LIST_RETENTION_DAYS = 2
+
+# Синхронизация рецептов (/api/recipes/changes/): размер пачки,
+# отставание верхней границы от текущего времени в секундах, чтобы
+# не пропустить ещё не зафиксированные транзакции, и срок хранения
+# следов удалённых рецептов.
+RECIPE_CHANGES_LIMIT = 100
+RECIPE_CHANGES_LAG = 2
+RECIPE_TOMBSTONE_RETENTION_DAYS = 30
+
+# Прогрев кешей (warm_caches): адреса, которые обходятся всегда,
+# наибольшее число тегов в перебираемых сочетаниях для первой
+# страницы рецептов и сколько рецептов первой страницы прогреть.
+WARM_CACHE_PATHS = [
+    '/api/tags/',
+    '/api/ingredients/',
+    '/api/recipes/',
+    '/api/recipes/?ordering=popular',
+    '/api/recipes/?ordering=trending',
+]
+WARM_CACHE_MAX_TAGS = 2
+WARM_CACHE_RECIPES = 6
 
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 
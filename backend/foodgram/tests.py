@@ -0,0 +1,148 @@
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection, router
+from django.http import HttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TransactionTestCase,
+                         override_settings)
+
+from recipes.models import Tag
+
+from .db import (PrimaryPinMiddleware, PrimaryReplicaRouter, _state,
+                 pin_to_primary)
+
+REPLICAS = ['replica_1', 'replica_2']
+AUTHORIZATION = 'Token 0123456789abcdef'
+
+
+@override_settings(DATABASE_REPLICAS=REPLICAS)
+class PrimaryReplicaRouterTest(SimpleTestCase):
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+    def tearDown(self):
+        _state.pinned = False
+
+    def test_reads_go_to_replicas(self):
+        for _ in range(10):
+            self.assertIn(self.router.db_for_read(Tag), REPLICAS)
+
+    def test_writes_go_to_primary(self):
+        self.assertEqual(self.router.db_for_write(Tag), DEFAULT_DB_ALIAS)
+
+    def test_migrations_only_on_primary(self):
+        self.assertTrue(self.router.allow_migrate(DEFAULT_DB_ALIAS, 'recipes'))
+        self.assertFalse(self.router.allow_migrate('replica_1', 'recipes'))
+
+    def test_pinned_reads_go_to_primary(self):
+        _state.pinned = True
+        self.assertEqual(self.router.db_for_read(Tag), DEFAULT_DB_ALIAS)
+
+    def test_pin_to_primary(self):
+        with pin_to_primary():
+            self.assertEqual(self.router.db_for_read(Tag), DEFAULT_DB_ALIAS)
+            with pin_to_primary():
+                pass
+            self.assertEqual(self.router.db_for_read(Tag), DEFAULT_DB_ALIAS)
+        self.assertIn(self.router.db_for_read(Tag), REPLICAS)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_reads_go_to_primary(self):
+        self.assertEqual(self.router.db_for_read(Tag), DEFAULT_DB_ALIAS)
+
+
+@override_settings(
+    DATABASE_REPLICAS=REPLICAS,
+    DB_CONN_HEALTH_CHECKS=False,
+    REPLICA_PIN_SECONDS=5,
+)
+class PrimaryPinMiddlewareTest(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.router = PrimaryReplicaRouter()
+
+    def tearDown(self):
+        cache.clear()
+
+    def run_request(self, method, status=200, **extra):
+        """Прогоняет запрос и возвращает БД, выбранную для чтения в нём."""
+        chosen = []
+
+        def get_response(request):
+            chosen.append(self.router.db_for_read(Tag))
+            return HttpResponse(status=status)
+
+        request = getattr(self.factory, method)('/api/recipes/', **extra)
+        PrimaryPinMiddleware(get_response)(request)
+        return chosen[0]
+
+    def test_write_reads_from_primary(self):
+        self.assertEqual(
+            self.run_request('post', HTTP_AUTHORIZATION=AUTHORIZATION),
+            DEFAULT_DB_ALIAS,
+        )
+
+    def test_reads_pinned_after_write(self):
+        self.run_request('post', status=201, HTTP_AUTHORIZATION=AUTHORIZATION)
+        self.assertEqual(
+            self.run_request('get', HTTP_AUTHORIZATION=AUTHORIZATION),
+            DEFAULT_DB_ALIAS,
+        )
+        self.assertIn(
+            self.run_request('get', HTTP_AUTHORIZATION='Token other'),
+            REPLICAS,
+        )
+
+    def test_failed_write_does_not_pin(self):
+        self.run_request('post', status=400, HTTP_AUTHORIZATION=AUTHORIZATION)
+        self.assertIn(
+            self.run_request('get', HTTP_AUTHORIZATION=AUTHORIZATION),
+            REPLICAS,
+        )
+
+    def test_anonymous_reads_from_replicas(self):
+        self.run_request('post', status=201)
+        self.assertIn(self.run_request('get'), REPLICAS)
+
+    def test_pin_released_after_request(self):
+        self.run_request('post', HTTP_AUTHORIZATION=AUTHORIZATION)
+        self.assertIn(self.router.db_for_read(Tag), REPLICAS)
+
+
+class ConnectionHealthCheckTest(TransactionTestCase):
+
+    def setUp(self):
+        connection.ensure_connection()
+        connection.health_checked_at = None
+
+    @override_settings(DB_CONN_HEALTH_CHECK_INTERVAL=60)
+    def test_checks_connection_once_per_interval(self):
+        with mock.patch.object(
+                connection, 'is_usable', return_value=True) as is_usable:
+            PrimaryPinMiddleware.close_unusable_connections()
+            PrimaryPinMiddleware.close_unusable_connections()
+        is_usable.assert_called_once()
+
+    @override_settings(DB_CONN_HEALTH_CHECK_INTERVAL=0)
+    def test_closes_unusable_connection(self):
+        with mock.patch.object(connection, 'is_usable', return_value=False), \
+                mock.patch.object(connection, 'close') as close:
+            PrimaryPinMiddleware.close_unusable_connections()
+        close.assert_called_once()
+
+
+@skipUnless(settings.DATABASE_REPLICAS, 'DB_REPLICA_HOSTS не заданы')
+class ReplicaReadTest(TransactionTestCase):
+    """Чтение через настоящий алиас реплики (в тестах - зеркало default)."""
+
+    databases = '__all__'
+
+    def test_replica_reads_primary_writes(self):
+        tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='zavtrak')
+        self.assertIn(router.db_for_read(Tag), settings.DATABASE_REPLICAS)
+        self.assertEqual(Tag.objects.get(pk=tag.pk).slug, 'zavtrak')
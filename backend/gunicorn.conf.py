@@ -0,0 +1,109 @@
+"""Настройки gunicorn для продакшена.
+
+Приложение загружается в мастер-процессе до форка (preload_app), там
+же прогреваются справочники, URL-резолвер и индекс ингредиентов:
+воркеры получают их готовыми и делят память copy-on-write. Воркеры
+пишут в лог память после старта и время первого запроса.
+"""
+import multiprocessing
+import os
+import time
+
+cpu_count = multiprocessing.cpu_count()
+
+bind = os.getenv('GUNICORN_BIND', '0:8000')
+# На малом числе ядер потоки дают конкурентность ожидания БД без
+# лишних процессов; на большом хватает процессов.
+worker_class = os.getenv(
+    'GUNICORN_WORKER_CLASS', 'gthread' if cpu_count < 4 else 'sync')
+workers = int(os.getenv('GUNICORN_WORKERS', cpu_count * 2 + 1))
+threads = int(os.getenv(
+    'GUNICORN_THREADS', 4 if worker_class == 'gthread' else 1))
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+warm_up_enabled = os.getenv('GUNICORN_WARM_UP', '1') == '1'
+# Перезапуск воркеров ограничивает рост памяти; разброс не даёт
+# им перезапуститься одновременно.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+
+def memory_usage():
+    """Rss и Pss процесса в мегабайтах. Pss делит общие страницы между
+    процессами, поэтому показывает выигрыш от preload_app."""
+    usage = {}
+    try:
+        with open('/proc/self/smaps_rollup') as file:
+            for line in file:
+                key, value = line.split(':', 1)
+                if key in ('Rss', 'Pss', 'Private_Dirty'):
+                    usage[key] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        import resource
+        usage['MaxRss'] = round(resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return usage
+
+
+def warm_up(log):
+    if not warm_up_enabled:
+        return
+    from django.core.cache import caches, close_caches
+    from django.core.cache.backends.locmem import LocMemCache
+    from django.db import connections
+    from django.urls import get_resolver
+
+    from recipes.catalogue import (
+        get_ingredient_catalogue, get_tag_catalogue
+    )
+    from recipes.ingredient_index import ingredient_index
+
+    started = time.monotonic()
+    if preload_app and isinstance(caches['default'], LocMemCache):
+        # Локальный кеш мастера унаследуют все воркеры: он очищается
+        # до прогрева, а справочники в нём живут ограниченный срок
+        # и не устаревают у воркеров, перезапущенных позже.
+        caches['default'].clear()
+    resolver = get_resolver()
+    resolver.resolve('/api/recipes/')
+    resolver.reverse_dict
+    get_tag_catalogue()
+    get_ingredient_catalogue()
+    with ingredient_index.lock:
+        ingredient_index.refresh()
+    # Соединения мастера с БД и кешем (сокеты memcached) нельзя
+    # делить с воркерами после форка.
+    connections.close_all()
+    close_caches()
+    log.info(
+        'Прогрев за %.1f мс, память %s',
+        (time.monotonic() - started) * 1000, memory_usage()
+    )
+
+
+def when_ready(server):
+    if preload_app:
+        warm_up(server.log)
+
+
+def post_worker_init(worker):
+    if not preload_app:
+        warm_up(worker.log)
+    worker.log.info('Воркер %s запущен, память %s', worker.pid, memory_usage())
+
+
+def pre_request(worker, req):
+    req.started_at = time.monotonic()
+
+
+def post_request(worker, req, environ, resp):
+    if getattr(worker, 'first_request_logged', False):
+        return
+    worker.first_request_logged = True
+    worker.log.info(
+        'Первый запрос воркера %s: %s %s за %.1f мс, память %s',
+        worker.pid, req.method, req.path,
+        (time.monotonic() - req.started_at) * 1000, memory_usage()
+    )
@@ -0,0 +1,85 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections, connection
+
+from foodgram.db import pin_to_primary
+from jobs.queue import claim_job, run_job, schedule_periodic
+
+
+class Command(BaseCommand):
+    help = 'Выполнение фоновых задач из очереди в БД'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.JOBS_CONCURRENCY,
+            help='Сколько задач выполнять одновременно (потоков)'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Пауза в секундах, если очередь пуста'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить все готовые задачи и завершиться'
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *args: self.stopping.set())
+        signal.signal(signal.SIGINT, lambda *args: self.stopping.set())
+        threads = [
+            threading.Thread(
+                target=self.work,
+                args=(options['poll_interval'], options['once']),
+                name=f'job-worker-{number}',
+            )
+            for number in range(options['concurrency'])
+        ]
+        for thread in threads:
+            thread.start()
+        if not options['once']:
+            self.schedule()
+        for thread in threads:
+            thread.join()
+
+    def schedule(self):
+        """Раз в минуту ставит в очередь периодические задачи."""
+        try:
+            with pin_to_primary():
+                while not self.stopping.is_set():
+                    close_old_connections()
+                    try:
+                        schedule_periodic()
+                    except DatabaseError as error:
+                        self.stderr.write(
+                            f'Не удалось запланировать задачи: {error}')
+                    self.stopping.wait(60)
+        finally:
+            connection.close()
+
+    def work(self, poll_interval, once):
+        try:
+            with pin_to_primary():
+                self.poll(poll_interval, once)
+        finally:
+            connection.close()
+
+    def poll(self, poll_interval, once):
+        while not self.stopping.is_set():
+            close_old_connections()
+            try:
+                claimed = claim_job()
+            except DatabaseError as error:
+                self.stderr.write(f'Не удалось взять задачу: {error}')
+                self.stopping.wait(poll_interval)
+                continue
+            if claimed is None:
+                if once:
+                    return
+                self.stopping.wait(poll_interval)
+                continue
+            run_job(claimed)
+            self.stdout.write(f'{claimed}')
@@ -0,0 +1,143 @@
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from foodgram.db import pin_to_primary
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def job(name):
+    """Регистрирует функцию как фоновую задачу с именем name.
+
+    Параметры задачи передаются функции именованными аргументами
+    и должны сериализоваться в JSON. Задача может выполниться
+    повторно, поэтому должна быть идемпотентной.
+    """
+    def decorator(func):
+        registry[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, dedupe=False, max_attempts=5, **payload):
+    """Ставит задачу в очередь и возвращает её запись.
+
+    Запись создаётся в текущей транзакции: воркер увидит задачу только
+    после фиксации, а при откате она пропадёт вместе с изменениями.
+    С dedupe=True повторная задача с теми же параметрами не создаётся,
+    пока предыдущая ждёт в очереди. В режиме JOBS_EAGER задача
+    выполняется в этом же процессе через transaction.on_commit.
+    """
+    if name not in registry:
+        raise KeyError(f'Неизвестная задача: {name}')
+    if dedupe:
+        pending = Job.objects.filter(
+            name=name, payload=payload, status=Job.PENDING).first()
+        if pending is not None:
+            return pending
+    queued = Job.objects.create(
+        name=name, payload=payload, max_attempts=max_attempts)
+    if settings.JOBS_EAGER:
+        transaction.on_commit(lambda: run_job(claim_job(queued.pk)))
+    return queued
+
+
+def schedule_periodic():
+    """Ставит в очередь периодические задачи из JOBS_SCHEDULE.
+
+    Задача ставится, только если предыдущий её запуск не ждёт в очереди
+    и не выполняется; следующий запуск - через интервал после
+    предыдущего. Блокировка в кеше не даёт нескольким воркерам
+    поставить одну задачу дважды.
+    """
+    if not cache.add(settings.JOBS_SCHEDULE_LOCK_KEY, True, 60):
+        return
+    try:
+        now = timezone.now()
+        for name, interval in settings.JOBS_SCHEDULE.items():
+            last = Job.objects.filter(name=name).order_by('-id').first()
+            if last is None:
+                run_at = now
+            elif last.status in (Job.PENDING, Job.RUNNING):
+                continue
+            else:
+                run_at = max(now, last.run_at + timedelta(seconds=interval))
+            Job.objects.create(name=name, run_at=run_at)
+    finally:
+        cache.delete(settings.JOBS_SCHEDULE_LOCK_KEY)
+
+
+def claim_job(pk=None):
+    """Забирает задачу в работу, пропуская заблокированные другими
+    воркерами (SELECT ... FOR UPDATE SKIP LOCKED).
+
+    Задачи, зависшие в работе дольше JOBS_LOCK_TIMEOUT, считаются
+    брошенными упавшим воркером и забираются снова.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)
+    queryset = Job.objects.select_for_update(skip_locked=True).filter(
+        Q(status=Job.PENDING, run_at__lte=now)
+        | Q(status=Job.RUNNING, locked_at__lt=stale)
+    ).order_by('run_at', 'id')
+    if pk is not None:
+        queryset = queryset.filter(pk=pk)
+    with transaction.atomic():
+        claimed = queryset.first()
+        if claimed is None:
+            return None
+        claimed.status = Job.RUNNING
+        claimed.locked_at = now
+        claimed.attempts += 1
+        claimed.save(update_fields=('status', 'locked_at', 'attempts'))
+    return claimed
+
+
+def retry_delay(attempts):
+    """Экспоненциальная задержка перед повтором со случайным разбросом."""
+    delay = min(
+        settings.JOBS_RETRY_BASE_DELAY * 2 ** (attempts - 1),
+        settings.JOBS_RETRY_MAX_DELAY
+    )
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def run_job(claimed):
+    """Выполняет взятую в работу задачу и сохраняет итог.
+
+    Задача читает из основной БД: реплика могла ещё не получить
+    данные, ради которых её поставили в очередь.
+    """
+    if claimed is None:
+        return
+    func = registry.get(claimed.name)
+    try:
+        if func is None:
+            raise KeyError(f'Неизвестная задача: {claimed.name}')
+        with pin_to_primary():
+            claimed.result = func(**claimed.payload)
+    except Exception:
+        logger.exception('Задача %s завершилась ошибкой', claimed)
+        claimed.last_error = traceback.format_exc()
+        if claimed.attempts >= claimed.max_attempts:
+            claimed.status = Job.FAILED
+            claimed.finished_at = timezone.now()
+        else:
+            claimed.status = Job.PENDING
+            claimed.run_at = timezone.now() + retry_delay(claimed.attempts)
+    else:
+        claimed.status = Job.DONE
+        claimed.finished_at = timezone.now()
+    claimed.locked_at = None
+    claimed.save()
@@ -0,0 +1,12 @@
+from django.contrib import admin
+
+from . import models
+
+
+@admin.register(models.OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'model', 'object_id', 'action', 'created_at',
+        'dispatched_at', 'attempts'
+    )
+    list_filter = ('model', 'action')
@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class OutboxConfig(AppConfig):
+    name = 'outbox'
+    verbose_name = 'События изменений'
+
+    def ready(self):
+        from .events import connect_signals
+        connect_signals()
+        autodiscover_modules('consumers')
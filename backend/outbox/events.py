@@ -0,0 +1,171 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+consumers = {}
+
+
+def consumer(name, models=None):
+    """Регистрирует получателя событий.
+
+    Получатель вызывается со списком событий, в котором оставлено
+    последнее событие по каждому объекту. models ограничивает события
+    метками моделей вида 'recipes.recipe'. Доставка «хотя бы один
+    раз»: после сбоя события придут повторно.
+    """
+    def decorator(func):
+        consumers[name] = (func, models and set(models))
+        return func
+    return decorator
+
+
+def get_payload(instance):
+    """Идентификаторы связанных объектов: после удаления объекта
+    получателю больше неоткуда их узнать."""
+    return {
+        field.attname: getattr(instance, field.attname)
+        for field in instance._meta.concrete_fields
+        if field.is_relation
+    }
+
+
+def record_event(model, object_id, action, payload=None):
+    """Записывает событие в текущей транзакции вместе с изменением."""
+    OutboxEvent.objects.create(
+        model=model._meta.label_lower,
+        object_id=object_id,
+        action=action,
+        payload=payload or {},
+    )
+    if settings.OUTBOX_EAGER:
+        # Одна доставка на транзакцию, сколько бы событий в ней ни было.
+        connection = transaction.get_connection()
+        if not any(func is dispatch_pending
+                   for _, func in connection.run_on_commit):
+            transaction.on_commit(dispatch_pending)
+
+
+def instance_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    record_event(
+        sender, instance.pk,
+        OutboxEvent.CREATED if created else OutboxEvent.UPDATED,
+        get_payload(instance)
+    )
+
+
+def instance_deleted(sender, instance, **kwargs):
+    record_event(
+        sender, instance.pk, OutboxEvent.DELETED, get_payload(instance))
+
+
+def connect_signals():
+    for label in settings.OUTBOX_MODELS:
+        model = apps.get_model(label)
+        post_save.connect(
+            instance_saved, sender=model, dispatch_uid=f'outbox_{label}')
+        post_delete.connect(
+            instance_deleted, sender=model, dispatch_uid=f'outbox_{label}')
+
+
+def coalesce(events):
+    """Оставляет последнее событие по каждому объекту."""
+    latest = {}
+    for event in events:
+        key = (event.model, event.object_id, str(sorted(
+            event.payload.items())) if event.object_id is None else None)
+        latest.pop(key, None)
+        latest[key] = event
+    return list(latest.values())
+
+
+def deliver(name, events):
+    """Передаёт получателю события его моделей."""
+    func, models = consumers[name]
+    relevant = [
+        event for event in events
+        if models is None or event.model in models
+    ]
+    if relevant:
+        func(coalesce(relevant))
+
+
+def dispatch(batch_size=None):
+    """Доставляет пачку недоставленных событий всем получателям.
+
+    События забираются через SELECT ... FOR UPDATE SKIP LOCKED и
+    отмечаются доставленными по отдельности, поэтому событие из
+    транзакции, зафиксированной позже соседних, не пропадает. Если
+    получатель упал, события остаются недоставленными и придут всем
+    получателям снова; после OUTBOX_MAX_ATTEMPTS попыток они
+    отмечаются доставленными с текстом ошибки.
+    Возвращает число доставленных событий.
+    """
+    if batch_size is None:
+        batch_size = settings.OUTBOX_BATCH_SIZE
+    with transaction.atomic():
+        events = list(OutboxEvent.objects.select_for_update(
+            skip_locked=True
+        ).filter(dispatched_at__isnull=True).order_by('id')[:batch_size])
+        if not events:
+            return 0
+        errors = []
+        for name in consumers:
+            try:
+                with transaction.atomic():
+                    deliver(name, events)
+            except Exception:
+                logger.exception('Получатель %s не обработал события', name)
+                errors.append(f'{name}: {traceback.format_exc()}')
+        now = timezone.now()
+        for event in events:
+            event.attempts += 1
+            event.last_error = '\n'.join(errors)
+            if not errors or event.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                event.dispatched_at = now
+        OutboxEvent.objects.bulk_update(
+            events, ('attempts', 'last_error', 'dispatched_at'))
+    return 0 if errors else len(events)
+
+
+def dispatch_pending():
+    """Доставляет пачками все недоставленные события."""
+    batch_size = settings.OUTBOX_BATCH_SIZE
+    while dispatch(batch_size) == batch_size:
+        pass
+
+
+def replay(name, from_id, batch_size=None):
+    """Заново доставляет одному получателю сохранённые события,
+    начиная с from_id. Возвращает число прочитанных событий."""
+    if batch_size is None:
+        batch_size = settings.OUTBOX_BATCH_SIZE
+    total = 0
+    last_id = from_id - 1
+    while True:
+        events = list(OutboxEvent.objects.filter(
+            id__gt=last_id).order_by('id')[:batch_size])
+        if not events:
+            return total
+        deliver(name, events)
+        total += len(events)
+        last_id = events[-1].id
+
+
+def prune(days):
+    """Удаляет события, доставленные больше days дней назад."""
+    deleted, _ = OutboxEvent.objects.filter(
+        dispatched_at__lt=timezone.now() - timedelta(days=days),
+    ).delete()
+    return deleted
@@ -0,0 +1,41 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from foodgram.db import pin_to_primary
+from outbox.events import dispatch, prune
+
+
+class Command(BaseCommand):
+    help = 'Доставка событий из outbox зарегистрированным получателям'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.OUTBOX_BATCH_SIZE)
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Пауза в секундах, если новых событий нет'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Доставить накопившиеся события и завершиться'
+        )
+
+    def handle(self, *args, **options):
+        stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *args: stopping.set())
+        signal.signal(signal.SIGINT, lambda *args: stopping.set())
+        while not stopping.is_set():
+            close_old_connections()
+            # Получатели читают только что изменённые объекты.
+            with pin_to_primary():
+                delivered = dispatch(options['batch_size'])
+            if delivered:
+                continue
+            if options['once']:
+                break
+            prune(settings.OUTBOX_RETENTION_DAYS)
+            stopping.wait(options['poll_interval'])
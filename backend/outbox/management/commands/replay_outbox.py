@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from foodgram.db import pin_to_primary
+from outbox.events import consumers, replay
+
+
+class Command(BaseCommand):
+    help = (
+        'Повторная доставка получателю сохранённых событий, начиная '
+        'с указанного id. Удалённые по сроку хранения события не '
+        'доставляются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('consumer', help='Имя получателя')
+        parser.add_argument(
+            '--from-id', type=int, default=1,
+            help='id первого события, которое нужно доставить заново'
+        )
+
+    def handle(self, *args, **options):
+        if options['consumer'] not in consumers:
+            raise CommandError(
+                'Неизвестный получатель. Доступны: '
+                + ', '.join(sorted(consumers))
+            )
+        with pin_to_primary():
+            total = replay(options['consumer'], options['from_id'])
+        self.stdout.write(
+            f'{options["consumer"]}: доставлено заново событий: {total}'
+        )
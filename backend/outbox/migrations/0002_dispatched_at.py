@@ -0,0 +1,60 @@
+# Generated by Django 3.2.5 on 2026-10-19 10:02
+
+from django.db import migrations, models
+from django.db.models import Min
+from django.db.models.functions import Now
+
+
+def mark_consumed(apps, schema_editor):
+    # События, которые уже прочитали все получатели, считаются
+    # доставленными; остальные будут доставлены заново.
+    ConsumerOffset = apps.get_model('outbox', 'ConsumerOffset')
+    OutboxEvent = apps.get_model('outbox', 'OutboxEvent')
+    db_alias = schema_editor.connection.alias
+    last_id = ConsumerOffset.objects.using(db_alias).aggregate(
+        last_id=Min('last_event_id'))['last_id']
+    if last_id is not None:
+        OutboxEvent.objects.using(db_alias).filter(
+            id__lte=last_id).update(dispatched_at=Now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('outbox', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Попыток доставки'),
+        ),
+        migrations.AddField(
+            model_name='outboxevent',
+            name='dispatched_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Дата доставки'),
+        ),
+        migrations.AddField(
+            model_name='outboxevent',
+            name='last_error',
+            field=models.TextField(blank=True, verbose_name='Последняя ошибка'),
+        ),
+        migrations.RunPython(mark_consumed, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='ConsumerOffset',
+        ),
+        migrations.AlterField(
+            model_name='outboxevent',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='Дата события'),
+        ),
+        migrations.AddIndex(
+            model_name='outboxevent',
+            index=models.Index(condition=models.Q(('dispatched_at__isnull', True)), fields=['id'], name='outbox_event_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='outboxevent',
+            index=models.Index(fields=['dispatched_at'], name='outbox_event_dispatched_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import models
+
+
+class OutboxEvent(models.Model):
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    ACTIONS = (
+        (CREATED, 'Создание'),
+        (UPDATED, 'Изменение'),
+        (DELETED, 'Удаление'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    model = models.CharField('Модель', max_length=100)
+    object_id = models.BigIntegerField('id объекта', null=True)
+    action = models.CharField('Действие', max_length=10, choices=ACTIONS)
+    payload = models.JSONField('Данные', default=dict)
+    created_at = models.DateTimeField('Дата события', auto_now_add=True)
+    dispatched_at = models.DateTimeField(
+        'Дата доставки', null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField('Попыток доставки', default=0)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # Недоставленных событий немного: частичный индекс по ним
+            # не растёт вместе с журналом.
+            models.Index(
+                fields=['id'],
+                condition=models.Q(dispatched_at__isnull=True),
+                name='outbox_event_pending_idx'
+            ),
+            models.Index(
+                fields=['dispatched_at'],
+                name='outbox_event_dispatched_idx'
+            ),
+        ]
+        verbose_name = 'Событие'
+        verbose_name_plural = 'События'
+
+    def __str__(self):
+        return f'{self.model} #{self.object_id} {self.action}'
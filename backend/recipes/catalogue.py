@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Ingredient, Tag
+
+TAG_CATALOGUE_KEY = 'tag_catalogue'
+INGREDIENT_CATALOGUE_KEY = 'ingredient_catalogue'
+
+
+def get_tag_catalogue():
+    """Все теги в виде словарей, как их отдаёт /api/tags/.
+
+    Сбрасывается при изменении тегов и в любом случае живёт в кеше
+    не дольше CATALOGUE_CACHE_TIMEOUT секунд.
+    """
+    tags = cache.get(TAG_CATALOGUE_KEY)
+    if tags is None:
+        tags = list(Tag.objects.values('id', 'name', 'color', 'slug'))
+        cache.set(TAG_CATALOGUE_KEY, tags, settings.CATALOGUE_CACHE_TIMEOUT)
+    return tags
+
+
+def invalidate_tag_catalogue():
+    cache.delete(TAG_CATALOGUE_KEY)
+
+
+def get_ingredient_catalogue():
+    """Все ингредиенты в виде словарей, как их отдаёт /api/ingredients/.
+
+    Сбрасывается при изменении ингредиентов и в любом случае живёт
+    в кеше не дольше CATALOGUE_CACHE_TIMEOUT секунд.
+    """
+    ingredients = cache.get(INGREDIENT_CATALOGUE_KEY)
+    if ingredients is None:
+        ingredients = list(Ingredient.objects.values(
+            'id', 'name', 'measurement_unit'))
+        cache.set(
+            INGREDIENT_CATALOGUE_KEY, ingredients,
+            settings.CATALOGUE_CACHE_TIMEOUT
+        )
+    return ingredients
+
+
+def invalidate_ingredient_catalogue():
+    cache.delete(INGREDIENT_CATALOGUE_KEY)
@@ -0,0 +1,21 @@
+from outbox.events import consumer
+from .catalogue import (
+    invalidate_ingredient_catalogue, invalidate_tag_catalogue
+)
+from .ingredient_index import bump_index_version
+
+
+@consumer('recipes.ingredient_index',
+          models=('recipes.recipe', 'recipes.ingredientforrecipe'))
+def refresh_ingredient_index(events):
+    bump_index_version()
+
+
+@consumer('recipes.tag_catalogue', models=('recipes.tag',))
+def refresh_tag_catalogue(events):
+    invalidate_tag_catalogue()
+
+
+@consumer('recipes.ingredient_catalogue', models=('recipes.ingredient',))
+def refresh_ingredient_catalogue(events):
+    invalidate_ingredient_catalogue()
@@ -0,0 +1,105 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Exists, OuterRef, Q
+
+from users.models import Subscription
+from .models import FeedEntry, Recipe
+
+BIG_AUTHORS_KEY = 'feed_big_authors'
+
+
+def has_fan_out(author):
+    """Рецепты авторов с огромным числом подписчиков не раскладываются
+    по лентам при публикации, а подмешиваются при чтении."""
+    followers = Subscription.objects.filter(author=author).count()
+    return followers <= settings.FEED_FANOUT_MAX_FOLLOWERS
+
+
+def fan_out_recipe(recipe):
+    """Раскладывает новый рецепт по лентам подписчиков пачками."""
+    if not has_fan_out(recipe.author_id):
+        return
+    followers = Subscription.objects.filter(
+        author=recipe.author_id
+    ).values_list('user_id', flat=True).order_by()
+    batch = []
+    for user_id in followers.iterator(chunk_size=settings.FEED_BATCH_SIZE):
+        batch.append(FeedEntry(
+            user_id=user_id,
+            recipe_id=recipe.id,
+            author_id=recipe.author_id,
+            pub_date=recipe.pub_date,
+        ))
+        if len(batch) >= settings.FEED_BATCH_SIZE:
+            FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def backfill_feed(user, author):
+    """Добавляет в ленту последние рецепты автора после подписки."""
+    if not has_fan_out(author):
+        return
+    recipes = Recipe.objects.filter(author=author).values_list(
+        'id', 'pub_date'
+    )[:settings.FEED_BACKFILL_SIZE]
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(
+                user_id=user.id,
+                recipe_id=recipe_id,
+                author_id=author.id,
+                pub_date=pub_date,
+            )
+            for recipe_id, pub_date in recipes
+        ],
+        ignore_conflicts=True
+    )
+
+
+def prune_feed(user, author_id):
+    """Убирает рецепты автора из ленты после отписки."""
+    FeedEntry.objects.filter(user=user, author_id=author_id).delete()
+
+
+def get_big_authors():
+    """Авторы, чьи рецепты не раскладываются по лентам.
+
+    Считаются одним агрегатом по подпискам не чаще раза в
+    FEED_BIG_AUTHORS_TIMEOUT секунд, а не при каждом чтении ленты.
+    """
+    authors = cache.get(BIG_AUTHORS_KEY)
+    if authors is None:
+        authors = set(
+            Subscription.objects.values('author').annotate(
+                followers=Count('id')
+            ).filter(
+                followers__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+            ).values_list('author', flat=True).order_by()
+        )
+        cache.set(BIG_AUTHORS_KEY, authors, settings.FEED_BIG_AUTHORS_TIMEOUT)
+    return authors
+
+
+def get_followed_big_authors(user):
+    """Крупные авторы среди подписок пользователя."""
+    big_authors = get_big_authors()
+    if not big_authors:
+        return []
+    return list(Subscription.objects.filter(
+        user=user, author__in=big_authors
+    ).values_list('author_id', flat=True))
+
+
+def get_feed_entries(user):
+    """Записи ленты: по индексу (user, -pub_date) без соединения
+    с рецептами; сами рецепты загружаются для одной страницы."""
+    return FeedEntry.objects.filter(user=user).only('recipe_id', 'pub_date')
+
+
+def get_feed_queryset(user, big_authors):
+    """Рецепты ленты: разложенные записи и рецепты крупных авторов."""
+    return Recipe.objects.filter(
+        Q(Exists(FeedEntry.objects.filter(user=user, recipe=OuterRef('pk'))))
+        | Q(author__in=big_authors)
+    )
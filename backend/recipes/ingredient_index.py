@@ -0,0 +1,177 @@
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import IngredientForRecipe, Recipe, RecipeTombstone
+
+INDEX_VERSION_KEY = 'ingredient_index_version'
+
+# Запас при дочитывании изменений: покрывает транзакции, которые
+# записали updated_at раньше, чем были зафиксированы.
+CHANGES_OVERLAP = timedelta(seconds=60)
+
+# Раз в столько секунд изменения дочитываются, даже если версия в
+# кеше не менялась: сброс версии мог не дойти до воркера.
+POLL_INTERVAL = 30
+
+# Раз в столько секунд индекс перестраивается целиком на случай
+# изменений, которые не отразились в updated_at.
+FULL_RELOAD_INTERVAL = 60 * 60
+
+
+def bump_index_version():
+    cache.set(INDEX_VERSION_KEY, time.time(), None)
+
+
+def load_postings(rows):
+    """Строки (ключ, id рецепта), упорядоченные по ключу и рецепту,
+    -> словарь ключ: массив id рецептов и словарь рецепт: ключи."""
+    keys, starts = np.unique(rows[:, 0], return_index=True)
+    postings = dict(zip(keys.tolist(), np.split(rows[:, 1], starts[1:])))
+    recipe_keys = {}
+    for key, recipe_id in rows.tolist():
+        recipe_keys.setdefault(recipe_id, set()).add(key)
+    return postings, recipe_keys
+
+
+def update_postings(postings, recipe_keys, recipe_id, keys):
+    """Переносит рецепт в массивы его новых ключей."""
+    previous = recipe_keys.get(recipe_id, set())
+    for key in previous - keys:
+        posting = postings[key]
+        postings[key] = posting[posting != recipe_id]
+    for key in keys - previous:
+        posting = postings.get(key, np.zeros(0, dtype=np.int64))
+        postings[key] = np.insert(
+            posting, np.searchsorted(posting, recipe_id), recipe_id)
+    if keys:
+        recipe_keys[recipe_id] = keys
+    else:
+        recipe_keys.pop(recipe_id, None)
+
+
+def read_rows(queryset, key):
+    return np.array(
+        queryset.order_by(key, 'recipe_id').values_list(key, 'recipe_id'),
+        dtype=np.int64
+    ).reshape(-1, 2)
+
+
+class IngredientIndex:
+    """Обратные индексы ингредиент -> отсортированный массив id рецептов
+    и тег -> отсортированный массив id рецептов.
+
+    Живёт в памяти каждого воркера. Сохранение рецепта меняет версию
+    в кеше, и воркеры дочитывают изменённые и удалённые рецепты при
+    следующем поиске, а без смены версии - раз в POLL_INTERVAL секунд.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.postings = {}
+        self.recipe_ingredients = {}
+        self.tag_postings = {}
+        self.recipe_tags = {}
+        self.totals = np.zeros(0, dtype=np.int32)
+        self.version = None
+        self.loaded_at = None
+        self.reloaded_at = 0
+        self.polled_at = 0
+
+    def search(self, ingredient_ids, tag_ids=None):
+        """Возвращает id рецептов и доли имеющихся ингредиентов,
+        по убыванию доли. tag_ids оставляет рецепты с любым из тегов."""
+        with self.lock:
+            self.refresh()
+            postings = [
+                self.postings[ingredient_id]
+                for ingredient_id in set(ingredient_ids)
+                if ingredient_id in self.postings
+            ]
+            tagged = None
+            if tag_ids is not None:
+                tagged = [
+                    self.tag_postings[tag_id] for tag_id in set(tag_ids)
+                    if tag_id in self.tag_postings
+                ]
+            totals = self.totals
+        if not postings or tagged == []:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        found, counts = np.unique(
+            np.concatenate(postings), return_counts=True)
+        if tagged is not None:
+            mask = np.isin(
+                found, np.concatenate(tagged), assume_unique=len(tagged) == 1)
+            found, counts = found[mask], counts[mask]
+        coverage = counts / totals[found]
+        order = np.lexsort((-found, -counts, -coverage))
+        return found[order], coverage[order]
+
+    def refresh(self):
+        version = cache.get(INDEX_VERSION_KEY)
+        now = time.monotonic()
+        if (self.loaded_at is None
+                or now - self.reloaded_at > FULL_RELOAD_INTERVAL):
+            self.load()
+        elif (version != self.version
+                or now - self.polled_at > POLL_INTERVAL):
+            self.apply_changes()
+        self.version = version
+        self.polled_at = now
+
+    def load(self):
+        loaded_at = timezone.now()
+        rows = read_rows(IngredientForRecipe.objects, 'ingredient_id')
+        self.postings, self.recipe_ingredients = load_postings(rows)
+        self.tag_postings, self.recipe_tags = load_postings(
+            read_rows(Recipe.tags.through.objects, 'tag_id'))
+        size = int(rows[:, 1].max()) + 1 if len(rows) else 0
+        self.totals = np.ones(size, dtype=np.int32)
+        for recipe_id, ingredients in self.recipe_ingredients.items():
+            self.totals[recipe_id] = len(ingredients)
+        self.loaded_at = loaded_at
+        self.reloaded_at = time.monotonic()
+
+    def apply_changes(self):
+        loaded_at = timezone.now()
+        since = self.loaded_at - CHANGES_OVERLAP
+        changed = set(Recipe.objects.filter(
+            updated_at__gte=since
+        ).values_list('id', flat=True))
+        ingredients = {recipe_id: set() for recipe_id in changed}
+        tags = {recipe_id: set() for recipe_id in changed}
+        for recipe_id, ingredient_id in IngredientForRecipe.objects.filter(
+                recipe_id__in=changed).values_list('recipe_id',
+                                                   'ingredient_id'):
+            ingredients[recipe_id].add(ingredient_id)
+        for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+                recipe_id__in=changed).values_list('recipe_id', 'tag_id'):
+            tags[recipe_id].add(tag_id)
+        for recipe_id in RecipeTombstone.objects.filter(
+                deleted_at__gte=since).values_list('recipe_id', flat=True):
+            ingredients.setdefault(recipe_id, set())
+            tags.setdefault(recipe_id, set())
+        for recipe_id in ingredients:
+            self.update_recipe(
+                recipe_id, ingredients[recipe_id], tags[recipe_id])
+        self.loaded_at = loaded_at
+
+    def update_recipe(self, recipe_id, ingredients, tags):
+        update_postings(
+            self.postings, self.recipe_ingredients, recipe_id, ingredients)
+        update_postings(self.tag_postings, self.recipe_tags, recipe_id, tags)
+        if not ingredients:
+            return
+        if recipe_id >= len(self.totals):
+            self.totals = np.concatenate([
+                self.totals,
+                np.ones(recipe_id + 1 - len(self.totals), dtype=np.int32)
+            ])
+        self.totals[recipe_id] = len(ingredients)
+
+
+ingredient_index = IngredientIndex()
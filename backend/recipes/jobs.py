@@ -0,0 +1,38 @@
+from django.core.management import call_command
+
+from jobs.queue import job
+from .feed import fan_out_recipe
+from .models import Recipe
+from .shopping_list import build_shopping_list
+
+
+@job('recipes.fan_out_recipe')
+def fan_out_recipe_job(recipe_id):
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is not None:
+        fan_out_recipe(recipe)
+
+
+@job('recipes.refresh_similar_recipes')
+def refresh_similar_recipes_job():
+    call_command('build_similar_recipes')
+
+
+@job('recipes.compute_recipe_scores')
+def compute_recipe_scores_job():
+    call_command('compute_recipe_scores')
+
+
+@job('recipes.prune_recipe_tombstones')
+def prune_recipe_tombstones_job():
+    call_command('prune_recipe_tombstones')
+
+
+@job('recipes.prune_shopping_lists')
+def prune_shopping_lists_job():
+    call_command('prune_shopping_lists')
+
+
+@job('recipes.build_shopping_list')
+def build_shopping_list_job(user_id):
+    return {'digest': build_shopping_list(user_id)}
@@ -0,0 +1,162 @@
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+from scipy import sparse
+
+from recipes.models import IngredientForRecipe, Recipe, SimilarRecipe
+
+# Вес тега относительно ингредиента в векторе рецепта.
+TAG_WEIGHT = 0.5
+
+
+class Command(BaseCommand):
+    help = (
+        'Расчёт похожих рецептов по косинусному сходству наборов '
+        'ингредиентов и тегов. Без --full пересчитываются только '
+        'рецепты, изменённые после прошлого запуска.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать соседей для всех рецептов'
+        )
+        parser.add_argument(
+            '--top-k', type=int, default=settings.SIMILAR_RECIPES_TOP_K,
+            help='Сколько похожих рецептов хранить для каждого'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько строк матрицы сходства считать за раз'
+        )
+
+    def handle(self, *args, **options):
+        # Отметка берётся до чтения данных: изменения, сделанные во
+        # время расчёта, попадут в следующий запуск.
+        last_run = SimilarRecipe.objects.aggregate(
+            last_run=Max('computed_at'))['last_run']
+        started_at = timezone.now()
+        recipe_ids, matrix = self.build_matrix()
+        if not len(recipe_ids):
+            return
+        top_k = min(options['top_k'], len(recipe_ids) - 1)
+        batch_size = options['batch_size']
+        if options['full'] or last_run is None:
+            targets = np.arange(len(recipe_ids))
+        else:
+            # Запас на транзакции, которые начались до прошлого запуска,
+            # а зафиксировались после чтения им данных.
+            since = last_run - timedelta(
+                seconds=settings.SIMILAR_RECIPES_OVERLAP)
+            targets = self.get_targets(
+                recipe_ids, matrix, since, top_k, batch_size)
+        for start in range(0, len(targets), batch_size):
+            self.store_neighbours(
+                recipe_ids, matrix, targets[start:start + batch_size],
+                top_k, started_at
+            )
+        self.stdout.write(
+            f'Пересчитано рецептов: {len(targets)} из {len(recipe_ids)}'
+        )
+
+    def get_targets(self, recipe_ids, matrix, since, top_k, batch_size):
+        """Рецепты, чьи соседи могли измениться с момента since.
+
+        Кроме самих изменённых, это рецепты, среди сохранённых соседей
+        которых есть изменённый, и рецепты, для которых изменённый
+        теперь ближе худшего сохранённого соседа или которым соседей
+        не хватает до top_k.
+        """
+        changed_ids = list(Recipe.objects.filter(
+            updated_at__gte=since).values_list('id', flat=True))
+        changed = np.flatnonzero(np.isin(recipe_ids, changed_ids))
+        targets = np.zeros(len(recipe_ids), dtype=bool)
+        if not len(changed):
+            return np.flatnonzero(targets)
+        targets[changed] = True
+        targets[np.isin(recipe_ids, list(
+            SimilarRecipe.objects.filter(
+                similar_id__in=changed_ids
+            ).values_list('recipe_id', flat=True).distinct()
+        ))] = True
+        best = np.zeros(len(recipe_ids), dtype=np.float32)
+        for start in range(0, len(changed), batch_size):
+            columns = changed[start:start + batch_size]
+            scores = (matrix @ matrix[columns].T).toarray()
+            scores[columns, np.arange(len(columns))] = 0
+            best = np.maximum(best, scores.max(axis=1))
+        worst = np.zeros(len(recipe_ids), dtype=np.float32)
+        count = np.zeros(len(recipe_ids), dtype=np.int64)
+        stored = np.array(
+            SimilarRecipe.objects.values('recipe_id').annotate(
+                worst=Min('score'), count=Count('id')
+            ).values_list('recipe_id', 'worst', 'count').order_by(),
+            dtype=np.float64
+        ).reshape(-1, 3)
+        stored = stored[np.isin(stored[:, 0], recipe_ids)]
+        rows = np.searchsorted(recipe_ids, stored[:, 0].astype(np.int64))
+        worst[rows] = stored[:, 1]
+        count[rows] = stored[:, 2]
+        targets |= (best > 0) & ((count < top_k) | (best > worst))
+        return np.flatnonzero(targets)
+
+    def build_matrix(self):
+        """Разреженная матрица рецепт x (ингредиенты + теги)
+        с нормированными строками."""
+        recipe_ids = np.fromiter(
+            Recipe.objects.order_by('id').values_list('id', flat=True),
+            dtype=np.int64
+        )
+        ingredients = np.array(
+            IngredientForRecipe.objects.values_list(
+                'recipe_id', 'ingredient_id'),
+            dtype=np.int64
+        ).reshape(-1, 2)
+        tags = np.array(
+            Recipe.tags.through.objects.values_list('recipe_id', 'tag_id'),
+            dtype=np.int64
+        ).reshape(-1, 2)
+        ingredient_ids, ingredient_cols = np.unique(
+            ingredients[:, 1], return_inverse=True)
+        tag_ids, tag_cols = np.unique(tags[:, 1], return_inverse=True)
+        rows = np.searchsorted(
+            recipe_ids, np.concatenate([ingredients[:, 0], tags[:, 0]]))
+        cols = np.concatenate(
+            [ingredient_cols, tag_cols + len(ingredient_ids)])
+        data = np.concatenate([
+            np.ones(len(ingredient_cols), dtype=np.float32),
+            np.full(len(tag_cols), TAG_WEIGHT, dtype=np.float32),
+        ])
+        matrix = sparse.csr_matrix(
+            (data, (rows, cols)),
+            shape=(len(recipe_ids), len(ingredient_ids) + len(tag_ids))
+        )
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)))
+        norms[norms == 0] = 1
+        return recipe_ids, sparse.csr_matrix(matrix.multiply(1 / norms))
+
+    def store_neighbours(self, recipe_ids, matrix, rows, top_k, computed_at):
+        scores = (matrix[rows] @ matrix.T).toarray()
+        scores[np.arange(len(rows)), rows] = 0
+        similar = []
+        if top_k > 0:
+            top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+            for index, columns in enumerate(top):
+                for column in columns:
+                    score = scores[index, column]
+                    if score > 0:
+                        similar.append(SimilarRecipe(
+                            recipe_id=int(recipe_ids[rows[index]]),
+                            similar_id=int(recipe_ids[column]),
+                            score=float(score),
+                            computed_at=computed_at,
+                        ))
+        with transaction.atomic():
+            SimilarRecipe.objects.filter(
+                recipe_id__in=recipe_ids[rows].tolist()).delete()
+            SimilarRecipe.objects.bulk_create(similar)
@@ -0,0 +1,70 @@
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.models import Favourite, RecipeScore, ShoppingList
+
+DAY = 24 * 60 * 60
+
+# Вклад одного добавления в избранное и в список покупок.
+WEIGHTS = ((Favourite, 1.0), (ShoppingList, 0.5))
+
+
+class Command(BaseCommand):
+    help = (
+        'Расчёт популярности рецептов по добавлениям в избранное '
+        'и список покупок с экспоненциальным затуханием. '
+        'Запускается периодически задачей recipes.compute_recipe_scores.'
+    )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        popular = {}
+        trending = {}
+        for model, weight in WEIGHTS:
+            recipe_ids, ages = self.load_events(model, now)
+            self.accumulate(
+                popular, recipe_ids, ages, weight,
+                settings.POPULAR_HALF_LIFE_DAYS
+            )
+            recent = ages <= settings.TRENDING_WINDOW_DAYS
+            self.accumulate(
+                trending, recipe_ids[recent], ages[recent], weight,
+                settings.TRENDING_HALF_LIFE_DAYS
+            )
+        scores = [
+            RecipeScore(
+                recipe_id=recipe_id,
+                popular=score,
+                trending=trending.get(recipe_id, 0.0),
+                computed_at=now,
+            )
+            for recipe_id, score in popular.items()
+        ]
+        with transaction.atomic():
+            RecipeScore.objects.all().delete()
+            RecipeScore.objects.bulk_create(scores, batch_size=1000)
+        self.stdout.write(f'Рассчитана популярность {len(scores)} рецептов')
+
+    @staticmethod
+    def load_events(model, now):
+        """Возвращает id рецептов и возраст добавлений в днях."""
+        rows = list(model.objects.values_list('recipe_id', 'added_at'))
+        recipe_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        ages = np.array(
+            [(now - row[1]).total_seconds() / DAY for row in rows],
+            dtype=np.float64
+        )
+        return recipe_ids, ages
+
+    @staticmethod
+    def accumulate(scores, recipe_ids, ages, weight, half_life):
+        if not len(recipe_ids):
+            return
+        unique_ids, positions = np.unique(recipe_ids, return_inverse=True)
+        sums = np.bincount(
+            positions, weights=weight * np.exp2(-ages / half_life))
+        for recipe_id, value in zip(unique_ids.tolist(), sums.tolist()):
+            scores[recipe_id] = scores.get(recipe_id, 0.0) + value
@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.models import RecipeTombstone
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаление следов рецептов, удалённых раньше срока хранения. '
+        'Клиенты со старым курсором после этого синхронизируются заново.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int,
+            default=settings.RECIPE_TOMBSTONE_RETENTION_DAYS,
+            help='Срок хранения в днях'
+        )
+
+    def handle(self, *args, **options):
+        deleted, _ = RecipeTombstone.objects.filter(
+            deleted_at__lt=timezone.now() - timedelta(days=options['days'])
+        ).delete()
+        self.stdout.write(f'Удалено записей: {deleted}')
@@ -0,0 +1,35 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаление файлов списков покупок, которые не готовились '
+        'заново дольше срока хранения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int,
+            default=settings.SHOPPING_LIST_RETENTION_DAYS,
+            help='Срок хранения в днях'
+        )
+
+    def handle(self, *args, **options):
+        expired = time.time() - options['days'] * 24 * 60 * 60
+        deleted = 0
+        try:
+            entries = list(os.scandir(settings.SHOPPING_LIST_DIR))
+        except FileNotFoundError:
+            entries = []
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < expired:
+                    os.remove(entry.path)
+                    deleted += 1
+            except FileNotFoundError:
+                continue
+        self.stdout.write(f'Удалено файлов: {deleted}')
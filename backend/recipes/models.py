@@ -1,6 +1,7 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -71,9 +72,17 @@ class Recipe(models.Model):
         verbose_name='Время приготовления в минутах'
     )
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['-pub_date'], name='recipe_pub_date_idx'),
+            models.Index(
+                fields=['updated_at', 'id'],
+                name='recipe_updated_at_id_idx'
+            ),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -124,6 +133,7 @@ class Favourite(models.Model):
         related_name='favorite',
         verbose_name='Рецепт'
     )
+    added_at = models.DateTimeField('Дата добавления', auto_now_add=True)
 
     class Meta:
         constraints = [
@@ -149,6 +159,7 @@ class ShoppingList(models.Model):
         related_name='shopping_list',
         verbose_name='Рецепт'
     )
+    added_at = models.DateTimeField('Дата добавления', auto_now_add=True)
 
     class Meta:
         constraints = [
@@ -162,3 +173,126 @@ class ShoppingList(models.Model):
 
     def __str__(self):
         return f'Список покупок {self.user.username}'
+
+
+class RecipeScore(models.Model):
+    """Популярность рецепта с затуханием во времени.
+
+    Заполняется командой compute_recipe_scores.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='score',
+        verbose_name='Рецепт'
+    )
+    popular = models.FloatField('Популярность', db_index=True)
+    trending = models.FloatField('Тренд', db_index=True)
+    computed_at = models.DateTimeField('Дата расчёта')
+
+    class Meta:
+        verbose_name = 'Популярность рецепта'
+        verbose_name_plural = 'Популярность рецептов'
+
+
+class SimilarRecipe(models.Model):
+    """Ближайший по ингредиентам и тегам рецепт.
+
+    Заполняется командой build_similar_recipes.
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='neighbours',
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='neighbour_of',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField('Сходство')
+    computed_at = models.DateTimeField('Дата расчёта')
+
+    class Meta:
+        ordering = ['-score']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='similar_recipe_unique'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'],
+                name='similar_recipe_score_idx'
+            ),
+        ]
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписчика, раскладывается при публикации."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        ordering = ['-pub_date']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='feed_entry_unique'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date'],
+                name='feed_entry_user_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_entry_user_author_idx'
+            ),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента подписок'
+
+
+class RecipeTombstone(models.Model):
+    """След удалённого рецепта для синхронизации клиентов."""
+    recipe_id = models.IntegerField('id рецепта')
+    deleted_at = models.DateTimeField('Дата удаления', default=timezone.now)
+
+    class Meta:
+        ordering = ['deleted_at']
+        indexes = [
+            models.Index(
+                fields=['deleted_at', 'recipe_id'],
+                name='tombstone_deleted_at_id_idx'
+            ),
+        ]
+        verbose_name = 'Удалённый рецепт'
+        verbose_name_plural = 'Удалённые рецепты'
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.deleted_at}'
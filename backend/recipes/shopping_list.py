@@ -0,0 +1,62 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.db.models import Sum
+
+from .models import IngredientForRecipe
+
+
+def get_cart_rows(user_id):
+    """Суммарное количество каждого ингредиента из списка покупок."""
+    return list(IngredientForRecipe.objects.filter(
+        recipe__shopping_list__user_id=user_id
+    ).values_list(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).order_by('ingredient__name').annotate(total=Sum('amount')))
+
+
+def iter_shopping_list(rows):
+    for number, (name, measurement_unit, total) in enumerate(rows, 1):
+        yield f'{number}. {name} - {total} {measurement_unit} \n'
+
+
+def render_shopping_list(rows):
+    return ''.join(iter_shopping_list(rows))
+
+
+def cart_digest(rows):
+    """Хеш содержимого списка: одинаковые списки делят один файл."""
+    return hashlib.sha256(
+        json.dumps(rows, ensure_ascii=False).encode()
+    ).hexdigest()
+
+
+def artifact_path(digest):
+    return os.path.join(settings.SHOPPING_LIST_DIR, f'{digest}.txt')
+
+
+def build_shopping_list(user_id):
+    """Готовит файл списка покупок и возвращает хеш его содержимого.
+
+    Если файл для такого же списка уже есть, он используется повторно
+    и его время изменения обновляется, чтобы prune_shopping_lists не
+    удалил его. Файл пишется во временный и переименовывается, поэтому
+    nginx никогда не отдаст недописанный файл.
+    """
+    rows = get_cart_rows(user_id)
+    digest = cart_digest(rows)
+    path = artifact_path(digest)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        os.makedirs(settings.SHOPPING_LIST_DIR, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(
+            dir=settings.SHOPPING_LIST_DIR, suffix='.tmp')
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+            file.write(render_shopping_list(rows))
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    return digest
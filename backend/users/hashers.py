@@ -0,0 +1,46 @@
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher
+
+# Одновременных вычислений хеша в процессе: остальные потоки воркера
+# в это время обслуживают другие запросы, а не делят ядро с логинами.
+hashing_slots = threading.BoundedSemaphore(
+    settings.PASSWORD_HASHING_CONCURRENCY)
+
+
+class PasswordHashingBusyError(Exception):
+    """Слот для хеширования не освободился за PASSWORD_HASHING_WAIT."""
+
+
+@contextmanager
+def hashing_slot():
+    """Занимает слот хеширования. Поток ждёт его не дольше
+    PASSWORD_HASHING_WAIT секунд, а не до конца очереди логинов."""
+    if not hashing_slots.acquire(timeout=settings.PASSWORD_HASHING_WAIT):
+        raise PasswordHashingBusyError
+    try:
+        yield
+    finally:
+        hashing_slots.release()
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """Argon2id с параметрами из настроек ARGON2_*.
+
+    Алгоритм совпадает со стандартным 'argon2', поэтому пароли,
+    захешированные с другими параметрами или PBKDF2, пересчитываются
+    при следующем входе.
+    """
+    time_cost = settings.ARGON2_TIME_COST
+    memory_cost = settings.ARGON2_MEMORY_COST
+    parallelism = settings.ARGON2_PARALLELISM
+
+    def encode(self, password, salt):
+        with hashing_slot():
+            return super().encode(password, salt)
+
+    def verify(self, password, encoded):
+        with hashing_slot():
+            return super().verify(password, encoded)
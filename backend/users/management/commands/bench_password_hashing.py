@@ -0,0 +1,50 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import get_hashers
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Пропускная способность проверки паролей для каждого хешера '
+        'из PASSWORD_HASHERS: на одно ядро и в нескольких потоках.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--duration', type=float, default=3.0,
+            help='Сколько секунд измерять каждый хешер'
+        )
+        parser.add_argument(
+            '--threads', type=int, default=4,
+            help='Потоков во втором замере, как у воркера gthread'
+        )
+
+    def handle(self, *args, **options):
+        for hasher in get_hashers():
+            encoded = hasher.encode('correct horse', hasher.salt())
+            single = self.measure(hasher, encoded, 1, options['duration'])
+            threaded = self.measure(
+                hasher, encoded, options['threads'], options['duration'])
+            self.stdout.write(
+                f'{hasher.__class__.__name__}: '
+                f'{single:.1f} проверок/с на ядро, '
+                f'{threaded:.1f} проверок/с в {options["threads"]} потоках'
+            )
+
+    @staticmethod
+    def measure(hasher, encoded, threads, duration):
+        deadline = time.monotonic() + duration
+
+        def worker():
+            done = 0
+            while time.monotonic() < deadline:
+                hasher.verify('correct horse', encoded)
+                done += 1
+            return done
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(threads) as pool:
+            total = sum(pool.map(lambda _: worker(), range(threads)))
+        return total / (time.monotonic() - started)
@@ -0,0 +1,37 @@
+from django.db import migrations
+
+FIELDS = ('username', 'first_name', 'last_name')
+
+
+def create_indexes(apps, schema_editor):
+    # Индексы по lower(...) для поиска пользователей по префиксу.
+    # В PostgreSQL varchar_pattern_ops позволяет использовать индекс
+    # для LIKE 'prefix%' при любой локали базы.
+    opclass = (
+        ' varchar_pattern_ops'
+        if schema_editor.connection.vendor == 'postgresql' else ''
+    )
+    for field in FIELDS:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS auth_user_{field}_lower_idx '
+            f'ON auth_user (lower({field}){opclass})'
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    for field in FIELDS:
+        schema_editor.execute(
+            f'DROP INDEX IF EXISTS auth_user_{field}_lower_idx'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]